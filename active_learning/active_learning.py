@@ -1,71 +1,253 @@
+import functools
+import hashlib
 import os
+import pickle
+import threading
+import time
 
 import numpy as np
 import pandas as pd
 
 from sklearn.base import clone
-from sklearn.preprocessing import scale
-from sklearn.linear_model import LogisticRegression
 from sklearn.metrics import f1_score, confusion_matrix
 
+from active_learning.backends import BACKENDS, MIN_LABELED, TOLERANCE, choose_backend, make_backend
+from active_learning.committee import Committee
+from active_learning.feature_cache import cache_dir, load_features, store_pool
+from active_learning.journal import LabelJournal
+from active_learning.strategies import get_strategy, smallest
+from util import timing
+
+# Format of the files written by save_session
+SESSION_VERSION = 2
+
+# Incremental training: passes over the flights of a round, and labeled flights of earlier rounds replayed with them
+INCREMENTAL_EPOCHS = 5
+REPLAY_SIZE = 1000
+
+# What is kept of the scores of the pool, see _score
+SCORES = ["_predicted", "_confidence", "_candidates", "_candidate_proba", "_candidate_disagreement", "_label_counts"]
+
+
+def _synchronized(method):
+    # The demo runs the model from worker threads, the methods that read or change the state hold the lock
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
 class ActiveLearning(object):
-    def __init__(self, labels, feature_file, data_dir, amount_to_label=10):
+    def __init__(self, labels, feature_file, data_dir, amount_to_label=10, incremental=False, chunk_size=65536,
+                 journal=None, query_strategy="default", reduction=None, n_components=64, committee=None,
+                 disagreement="vote_entropy", backend=None, backend_tolerance=TOLERANCE):
         self.labels = labels
         self.feature_file = feature_file
         self.data_dir = data_dir
         self.amount_to_label = amount_to_label
+        self.incremental = incremental
+        self.chunk_size = chunk_size
+        self.query_strategy = get_strategy(query_strategy)
+        if self.query_strategy.uses_disagreement and not committee:
+            raise ValueError("The query strategy needs a committee")
+        if committee and incremental:
+            raise ValueError("A committee can not be trained incrementally")
         self.validation = None
-
-        # Load feature file
-        self.data = pd.read_csv(feature_file)
-        self.data.drop_duplicates(subset="filename")
-
-        # Make transformations to the features
-        features = self.data.columns[:-2]
-        self.data[features] = self.data[features].apply(scale)
-        self.data[features] = self.data[features].apply(np.negative)
-        self.data[features] = self.data[features].apply(np.exp)
-
-        # Strip folders from filename
-        self.data["filename"] = self.data["filename"].apply(lambda x: os.path.join(self.data_dir, os.path.basename(x)))
-
-        # Initialize the classifier
-        self.model = LogisticRegression(
-            penalty='l2',
-            C=.01,
-            class_weight="balanced",
-            random_state=None,
-            n_jobs=-1,
-            warm_start=False,
-            fit_intercept=True
-        )
+        self.validation_features = None
+        self.validation_labels = None
+
+        # Called with the fraction of the pool scored so far
+        self.on_progress = None
+        self._lock = threading.RLock()
+
+        # Load the transformed features, reduced to n_components with a reduction, from the cache next to the
+        # feature file when it is up to date. The statistics of the transform and the reduction are kept to
+        # transform the flights added later in the same way.
+        matrix = load_features(feature_file, reduction, n_components)
+        self.feature_names = matrix.names
+        self._feature_mean = matrix.mean
+        self._feature_std = matrix.std
+        self._reduction = matrix.reduction
+        self.features = matrix.features
+        self.cluster_labels = matrix.labels
+        self._fingerprint = matrix.fingerprint
+        # Names the pools written by store_pool, changes with every change of the rows of the pool
+        self._pool_key = hashlib.sha1(self._fingerprint.encode("utf-8")).hexdigest()
+
+        # Flights are looked for in data_dir, whatever folder the feature file names
+        self.filenames = np.char.add(os.path.join(self.data_dir, ""), matrix.basenames).astype(object)
+
+        # Initialize the classifier, a backend of active_learning.backends. Incremental training needs sgd, the
+        # only one with partial_fit. "auto" is chosen once MIN_LABELED flights are labeled, see _choose_backend,
+        # lbfgs stands in until then. backend_results is the comparison the choice was made on.
+        if backend is None or (backend == "auto" and self.incremental):
+            backend = "sgd" if self.incremental else "lbfgs"
+        if self.incremental and backend != "sgd":
+            raise ValueError("Only the sgd backend can be trained incrementally")
+        self.backend = backend
+        self.backend_tolerance = backend_tolerance
+        self.backend_results = None
+        self.model = make_backend("lbfgs" if backend == "auto" else backend)
+
+        # A committee of `committee` models trained in parallel, scored by their mean and their disagreement
+        self.committee = committee or None
+        self.disagreement = disagreement if committee else None
+        if committee:
+            self.model = Committee(self.model, n_members=committee, disagreement=disagreement)
 
         self.labeled_flights = dict()
-
+        self.fit_times = []
+        self._rng = np.random.RandomState(26)
+
+        # Every change of the labeled set bumps the version, the fitted model and its scores are reused until then
+        self._labels_version = 0
+        self._fitted_version = None
+        self._predicted = None
+        self._confidence = None
+        self._candidates = None
+        self._candidate_proba = None
+        self._candidate_disagreement = None
+        self._label_counts = None
+        self._validation_predicted = None
+        self._centroids = None
+
+        # Every change of the labels is written to the journal, the labels of an interrupted session are read back
+        self.journal = None
+        if journal is not None:
+            self.journal = LabelJournal(journal)
+            if self.journal.names is not None:
+                self.labels = list(self.journal.names)
+            self.labeled_flights = {os.path.join(self.data_dir, f): l for f, l in self.journal.labels.items()}
+
+        self._index_pool()
+
+    def _index_pool(self):
+        # The pool is kept as plain arrays so that train/test splits are boolean masks instead of DataFrame copies
+        self.flight_index = {filename: i for i, filename in enumerate(self.filenames)}
+        self._reset_labels()
+
+    def _reset_labels(self):
+        self._labels_version += 1
+        self.flight_labels = np.full(len(self.filenames), -1, dtype=int)
+        self.labeled_mask = np.zeros(len(self.filenames), dtype=bool)
+
+        # None means the model has to be trained from scratch on the whole labeled set
+        self._new_rows = None
+        self._set_labels(self.labeled_flights.items())
+
+    def _set_labels(self, new_labels):
+        # Only touches the rows of the given flights, flights outside the pool are ignored
+        self._labels_version += 1
+        for flight, label in new_labels:
+            idx = self.flight_index.get(flight)
+            if idx is not None:
+                self.flight_labels[idx] = label
+                self.labeled_mask[idx] = True
+                if self._new_rows is not None:
+                    self._new_rows.append(idx)
+
+    @_synchronized
+    @timing.timed("model.load_validation")
     def load_validation(self, filename):
-        self.validation = pd.read_csv(filename)
-        rename = {"label": {name: idx for idx, name in enumerate(self.labels)}}
-        self.validation.replace(rename, inplace=True)
-
-        tmp = self.data.loc[self.data["filename"].isin(self.validation["filename"])]
-        for idx, row in tmp.iterrows():
-            new_value = list(self.validation["label"].loc[self.validation["filename"] == row["filename"]])[0]
-            tmp.set_value(idx, "label", new_value)
-        self.validation = tmp
-
-        self.data = self.data.loc[~self.data["filename"].isin(self.validation["filename"])]
-
-
+        validation = pd.read_csv(filename)
+        validation["label"] = validation["label"].replace({name: idx for idx, name in enumerate(self.labels)})
+        # Flights are looked for in data_dir, as the ones of the feature file
+        validation["filename"] = [os.path.join(self.data_dir, os.path.basename(f)) for f in validation["filename"]]
+        validation = validation.drop_duplicates(subset="filename")
+
+        # Validation flights are taken out of the pool, in pool order, with their features extracted once
+        pool = pd.DataFrame({"row": np.arange(len(self.filenames))}, index=pd.Index(self.filenames, name="filename"))
+        matched = pool.join(validation.set_index("filename")["label"], how="inner")
+        rows = matched["row"].to_numpy()
+        if len(rows) == 0:
+            return
+
+        self.validation = matched.reset_index()[["filename", "label"]]
+        self.validation_features = self.features[rows]
+        self.validation_labels = matched["label"].to_numpy().astype(int)
+
+        keep = np.ones(len(self.filenames), dtype=bool)
+        keep[rows] = False
+        self._take_pool(keep)
+
+    @_synchronized
+    def keep_flights(self, file_names):
+        # Takes the flights that are not in file_names out of the pool, as if the feature file only had the others
+        file_names = set(file_names)
+        keep = np.array([filename in file_names for filename in self.filenames], dtype=bool)
+        if not keep.all():
+            self._take_pool(keep)
+
+    def _take_pool(self, keep):
+        # The pool stays memory-mapped, written once to the cache of the feature file
+        sha = hashlib.sha1(self._pool_key.encode("utf-8"))
+        sha.update(np.flatnonzero(~keep).astype(np.int64).tobytes())
+        self._pool_key = sha.hexdigest()
+        self.features = store_pool(self.feature_file, self._pool_key, self.features, np.flatnonzero(keep))
+        self.filenames = self.filenames[keep]
+        self.cluster_labels = self.cluster_labels[keep]
+        self._index_pool()
+
+    @_synchronized
+    @timing.timed("model.add_flights")
+    def add_flights(self, data):
+        # Brings new flights into the pool as unlabeled flights. data has the layout of the feature file (as returned
+        # by active_learning.features.update_features), flights already in the pool or in the validation set are
+        # skipped. Labels given to the new flights before are applied. Returns the number of flights added.
+        data = data.copy()
+        data["filename"] = data["filename"].apply(lambda x: os.path.join(self.data_dir, os.path.basename(x)))
+        data = data.drop_duplicates(subset="filename")
+        known = data["filename"].isin(self.flight_index)
+        if self.validation is not None:
+            known |= data["filename"].isin(self.validation["filename"])
+        data = data.loc[~known].reset_index(drop=True)
+        if len(data) == 0:
+            return 0
+
+        features = data[self.feature_names].to_numpy(dtype=np.float64)
+        features = np.exp(-(features - self._feature_mean) / self._feature_std)
+        if self._reduction is not None:
+            features = self._reduction.transform(features)
+        features = features.astype(self.features.dtype)
+
+        start = len(self.filenames)
+        sha = hashlib.sha1(self._pool_key.encode("utf-8"))
+        sha.update(features.tobytes())
+        sha.update("\n".join(data["filename"].map(os.path.basename)).encode("utf-8"))
+        self._pool_key = sha.hexdigest()
+        self.features = store_pool(self.feature_file, self._pool_key, self.features, np.arange(start), features)
+        self.filenames = np.concatenate([self.filenames, data["filename"].to_numpy(dtype=object)])
+        self.cluster_labels = np.concatenate([self.cluster_labels, data["label"].to_numpy().astype(int)])
+        self.flight_index.update((filename, start + i) for i, filename in enumerate(data["filename"]))
+        self.flight_labels = np.concatenate([self.flight_labels, np.full(len(data), -1, dtype=int)])
+        self.labeled_mask = np.concatenate([self.labeled_mask, np.zeros(len(data), dtype=bool)])
+
+        new_labels = [(flight, self.labeled_flights[flight]) for flight in data["filename"]
+                      if flight in self.labeled_flights]
+        if new_labels:
+            self._set_labels(new_labels)
+        elif self._fitted_version == self._labels_version:
+            # The model does not change, only the new flights have to be scored
+            self._score(start)
+
+        return len(data)
+
+    @_synchronized
     def restart(self):
         self.labeled_flights = dict()
         self.model = clone(self.model)
+        self._reset_labels()
+        self._journal_reset()
 
+    @_synchronized
     def save_to_csv(self, filename):
         fn, lbl = self.get_labeled_training()
         lbl = [self.labels[l] for l in lbl]
         data = pd.DataFrame({"filename": fn, "label": lbl})
         data.to_csv(filename, index=False)
 
+    @_synchronized
     def load_from_csv(self, filename):
 
         try:
@@ -76,126 +258,323 @@ class ActiveLearning(object):
             self.labeled_flights = dict()
             for _, row in data.iterrows():
                 self.labeled_flights[row["filename"]] = lbl_idx[row["label"]]
+            self._reset_labels()
+            self._journal_reset()
 
             return True
         except:
             return False
 
+    def _pool_fingerprint(self):
+        # Identifies the features of the pool and their order, the scores of a session only hold for the same pool
+        sha = hashlib.sha1(self._fingerprint.encode("utf-8"))
+        sha.update("\n".join(map(os.path.basename, self.filenames)).encode("utf-8"))
+        return sha.hexdigest()
+
+    def _strategy_fingerprint(self):
+        # The candidates kept by _score depend on the query strategy and on the size of the batches
+        return "{}:{}".format(type(self.query_strategy).__name__, self.amount_to_label)
+
+    @_synchronized
+    @timing.timed("model.save_session")
+    def save_session(self, filename):
+        # Labels and label names, plus the fitted model and the scores of the pool when they are up to date, so
+        # load_session can go on without training the model again
+        fitted = self._fitted_version == self._labels_version
+        session = {
+            "version": SESSION_VERSION,
+            "labels": self.labels,
+            "labeled_flights": {os.path.basename(f): l for f, l in self.labeled_flights.items()},
+            "incremental": self.incremental,
+            "backend": self.backend,
+            "committee": self.committee,
+            "disagreement": self.disagreement,
+            "pool": self._pool_fingerprint(),
+            "strategy": self._strategy_fingerprint(),
+            "model": self.model if fitted else None,
+            "scores": {name: getattr(self, name) for name in SCORES} if fitted else None,
+        }
+
+        # Written next to the target first, an interrupted save leaves the previous session intact
+        with open(filename + ".tmp", "wb") as fh:
+            pickle.dump(session, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(filename + ".tmp", filename)
+
+    @_synchronized
+    @timing.timed("model.load_session")
+    def load_session(self, filename):
+        try:
+            with open(filename, "rb") as fh:
+                session = pickle.load(fh)
+            if session["version"] != SESSION_VERSION:
+                return False
+        except:
+            return False
+
+        self.labels = list(session["labels"])
+        self.labeled_flights = {os.path.join(self.data_dir, f): l for f, l in session["labeled_flights"].items()}
+        self._reset_labels()
+        self._journal_reset()
+
+        # The saved model and scores are only used when they were computed on this same pool, by the same backend or
+        # by the one an auto backend chose, and with the same committee
+        backend = session.get("backend")
+        if (session["model"] is not None and session["incremental"] == self.incremental and
+                (backend == self.backend or (self.backend == "auto" and backend in BACKENDS)) and
+                session.get("committee") == self.committee and session.get("disagreement") == self.disagreement and
+                session["pool"] == self._pool_fingerprint() and session["strategy"] == self._strategy_fingerprint()):
+            self.backend = backend
+            self.model = session["model"]
+            for name, value in session["scores"].items():
+                setattr(self, name, value)
+            self._new_rows = []
+            if self.validation is not None:
+                self._validation_predicted = self.model.predict(self.validation_features)
+            self._fitted_version = self._labels_version
+        else:
+            self.model = clone(self.model)
+
+        return True
+
     def get_label_names(self):
         return self.labels[:]
 
+    @_synchronized
     def set_label_names(self, labels):
         self.labels = labels[:]
+        self._journal_reset()
+
+    def _journal_reset(self):
+        # The labels were replaced as a whole
+        if self.journal is not None:
+            self.journal.reset(self.labeled_flights, self.labels)
 
+    @_synchronized
+    @timing.timed("model.label_flights")
     def label_flights(self, new_labels):
         # Update labels
+        new_labels = list(new_labels)
         for flight, label in new_labels:
             self.labeled_flights[flight] = label
+        self._set_labels(new_labels)
+        if self.journal is not None:
+            self.journal.append(new_labels)
+
+    @_synchronized
+    @timing.timed("model.get_centroids")
+    def get_centroids(self, top_k=1):
+        # The top_k flights of every cluster the model is most sure belong to it, cluster by cluster
+        own = self._centroid_scores()
+        clusters = np.unique(self.cluster_labels)
+
+        if top_k == 1:
+            # Scores of each flight for its own cluster only, the last flight wins ties
+            scores = np.where(self.cluster_labels[::-1, None] == clusters[None, :], own[::-1, None], -np.inf)
+            return list(self.filenames[len(own) - 1 - np.argmax(scores, axis=0)])
 
-    def get_centroids(self):
-        # Identifying centroids
-        train_data = self.data.drop(["label", "filename"], axis=1)
-        train_labels = list(self.data["label"].astype(int))
-
-        model = clone(self.model)
-        model.fit(train_data, train_labels)
-
-        # Predicted probability for each instance
-        probs = model.predict_proba(train_data)
-
-        # Sort flights of each cluster by probability
-        num_clusters = len(self.data['label'].unique())
-        sorted_probs = [[] for i in range(num_clusters)]
-        for i, prob in enumerate(probs):
-            sorted_probs[train_labels[i]].append((i, prob[train_labels[i]]))
-        for i in range(num_clusters):
-            sorted_probs[i] = sorted(sorted_probs[i], key=lambda x: x[1])
-
-        # Get centroids
         centroids = []
-        file_names = list(self.data["filename"])
-        for cluster, l in enumerate(sorted_probs):
-            centroid = file_names[l[-1][0]]
-            centroids.append(centroid)
-
+        rows = np.arange(len(own))
+        for cluster in clusters:
+            best = smallest([-own, -rows], top_k, np.flatnonzero(self.cluster_labels == cluster))
+            centroids.extend(self.filenames[best])
         return centroids
 
+    def _centroid_scores(self):
+        # Probability of every flight for its initial cluster, from the model trained on those clusters. Only depends
+        # on the pool and the model, so it is kept next to the feature cache and computed once.
+        key = hashlib.sha1("{}|{}".format(self._pool_fingerprint(), sorted(self.model.get_params().items()))
+                           .encode("utf-8")).hexdigest()
+        if self._centroids is not None and self._centroids[0] == key:
+            return self._centroids[1]
+
+        path = os.path.join(cache_dir(self.feature_file), "centroids-{}.npy".format(key))
+        if os.path.exists(path):
+            own = np.load(path)
+        else:
+            # A single model is enough to rank the flights of the clusters, also in committee mode
+            model = clone(self.model.estimator if isinstance(self.model, Committee) else self.model)
+            model.fit(self.features, self.cluster_labels)
+            columns = np.searchsorted(model.classes_, self.cluster_labels)
+            own = np.empty(len(self.features))
+            for start, proba, _ in self._iter_proba(self.features, model):
+                end = start + len(proba)
+                own[start:end] = proba[np.arange(len(proba)), columns[start:end]]
+
+            try:
+                with open(path + ".tmp", "wb") as fh:
+                    np.save(fh, own)
+                os.replace(path + ".tmp", path)
+            except OSError:
+                # Read-only location, computed again next time
+                pass
+
+        self._centroids = (key, own)
+        return own
+
+    def _choose_backend(self):
+        # The backends are fitted on the labeled flights and compared on the validation flights. Without them lbfgs
+        # is kept, and it stands in until MIN_LABELED flights of at least two labels are labeled.
+        train = self.labeled_mask
+        if self.validation is None:
+            backend = "lbfgs"
+        elif train.sum() < MIN_LABELED or len(np.unique(self.flight_labels[train])) < 2:
+            return
+        else:
+            backend, self.backend_results = choose_backend(self.features[train], self.flight_labels[train],
+                                                           self.validation_features, self.validation_labels,
+                                                           self.features, self.backend_tolerance)
+
+        self.backend = backend
+        if isinstance(self.model, Committee):
+            self.model = clone(self.model).set_params(estimator=make_backend(backend))
+        else:
+            self.model = make_backend(backend)
+
+    @_synchronized
     def reset_model(self):
         self.model = clone(self.model)
         self.labeled_flights = dict()
+        self._reset_labels()
+        self._journal_reset()
+
+    def _fit(self):
+        if self._fitted_version == self._labels_version:
+            return
+
+        if self.backend == "auto":
+            self._choose_backend()
+
+        # Train model with the labeled data
+        start = time.time()
+        train = self.labeled_mask
+        with timing.timer("model.fit"):
+            if not self.incremental:
+                self.model.fit(self.features[train], self.flight_labels[train])
+            elif self._new_rows is None:
+                self.model = clone(self.model)
+                self._partial_fit(np.flatnonzero(train))
+            elif self._new_rows:
+                self._partial_fit(np.unique(self._new_rows))
+        self._new_rows = []
+        self.fit_times.append(time.time() - start)
+
+        # Score the whole pool once
+        self._score()
 
+        if self.validation is not None:
+            self._validation_predicted = self.model.predict(self.validation_features)
+
+        self._fitted_version = self._labels_version
+
+    def _partial_fit(self, rows):
+        # The new rows together with up to REPLAY_SIZE of the other labeled flights, for INCREMENTAL_EPOCHS shuffled
+        # passes. Weighted as class_weight="balanced" would, by the counts of all the labeled flights, so the rare
+        # labels are not forgotten between rounds.
+        labeled = np.flatnonzero(self.labeled_mask)
+        earlier = np.setdiff1d(labeled, rows)
+        if len(earlier) > REPLAY_SIZE:
+            earlier = self._rng.choice(earlier, REPLAY_SIZE, replace=False)
+        rows = np.concatenate([rows, earlier])
+
+        counts = np.bincount(self.flight_labels[labeled], minlength=len(self.labels))
+        labels = self.flight_labels[rows]
+        weights = len(labeled) / (np.count_nonzero(counts) * counts[labels].astype(float))
+        features = self.features[rows]
+
+        classes = np.arange(len(self.labels))
+        for _ in range(INCREMENTAL_EPOCHS):
+            order = self._rng.permutation(len(rows))
+            self.model.partial_fit(features[order], labels[order], classes=classes, sample_weight=weights[order])
+
+    def _iter_proba(self, features, model=None, disagreement=False):
+        # Probabilities of the rows of features, chunk by chunk as (first row, probabilities, disagreement). Only one
+        # chunk is in memory at a time, and only one chunk of features is read when they are memory-mapped. The
+        # disagreement of a committee is only computed when asked for, it is None otherwise.
+        model = self.model if model is None else model
+        for start in range(0, len(features), self.chunk_size):
+            end = start + self.chunk_size
+            with timing.timer("model.predict_proba"):
+                if disagreement:
+                    proba, chunk_disagreement = model.predict_proba_disagreement(features[start:end])
+                else:
+                    proba, chunk_disagreement = model.predict_proba(features[start:end]), None
+            yield start, proba, chunk_disagreement
+            if self.on_progress is not None:
+                self.on_progress(min(end, len(features)) / float(len(features)))
+
+    def _score(self, start=0):
+        # Scores the pool from row start on, the rows before keep their scores. Instead of all the probabilities,
+        # every flight keeps its predicted label and the probability of that label, and the unlabeled flights of
+        # each chunk that the query strategy could choose are kept with their probabilities (_candidates,
+        # _candidate_proba) and, for a committee, disagreement. _label_counts counts the unlabeled flights predicted
+        # as each label.
+        classes = len(self.model.classes_)
+        if start == 0:
+            self._predicted = np.empty(0, dtype=self.model.classes_.dtype)
+            self._confidence = np.empty(0, dtype=np.float32)
+            self._candidates = np.empty(0, dtype=int)
+            self._candidate_proba = np.empty((0, classes))
+            self._candidate_disagreement = np.empty(0)
+            self._label_counts = np.zeros(classes, dtype=int)
+
+        predicted, confidence = [self._predicted], [self._confidence]
+        candidates, candidate_proba = [self._candidates], [self._candidate_proba]
+        candidate_disagreement = [self._candidate_disagreement]
+        committee = isinstance(self.model, Committee)
+        for offset, proba, disagreement in self._iter_proba(self.features[start:], disagreement=committee):
+            rows = np.arange(start + offset, start + offset + len(proba))
+            best = np.argmax(proba, axis=1)
+            predicted.append(self.model.classes_[best])
+            confidence.append(proba[np.arange(len(proba)), best].astype(np.float32))
+
+            test = ~self.labeled_mask[rows]
+            self._label_counts += np.bincount(best[test], minlength=classes)
+            test = np.flatnonzero(test)
+            if committee:
+                disagreement = disagreement[test]
+            chosen = self.query_strategy.reduce(proba[test], self.filenames[rows[test]], self.amount_to_label,
+                                                disagreement)
+            candidates.append(rows[test[chosen]])
+            candidate_proba.append(proba[test[chosen]])
+            if committee:
+                candidate_disagreement.append(disagreement[chosen])
+
+        self._predicted = np.concatenate(predicted)
+        self._confidence = np.concatenate(confidence)
+        self._candidates = np.concatenate(candidates)
+        self._candidate_proba = np.concatenate(candidate_proba)
+        self._candidate_disagreement = np.concatenate(candidate_disagreement)
+
+    @_synchronized
+    @timing.timed("model.get_flights_to_label")
     def get_flights_to_label(self):
-        # Create version of data with the labels given by user
-        data_with_labels = self.data.copy()
-
-        # Add labels to the data
-        data_with_labels["label"] = -1
-        for filename, label in self.labeled_flights.items():
-            data_with_labels.loc[data_with_labels["filename"] == filename, "label"] = label
-
-        # Separate into training and test
-        train = data_with_labels.loc[data_with_labels["filename"].isin(self.labeled_flights.keys())].copy()
-        train_labels = train["label"]
-        train.drop(["label", "filename"], axis=1, inplace=True)
-        test = data_with_labels.loc[~data_with_labels["filename"].isin(self.labeled_flights.keys())].copy()
-        test_filenames = list(test["filename"])
-        test.drop(["label", "filename"], axis=1, inplace=True)
-
-        # Train model with the new labeled data
-        self.model.fit(train, train_labels)
-
-        # Get and sort probabilities for the test data
-        probs = self.model.predict_proba(test)
-        return self._select_flights(probs, test_filenames)
-
-    def _select_flights(self, probabilities, file_names):
-        sorted_probs = [[np.max(p), np.argmax(p), file_names[i]] + list(p) for i, p in enumerate(probabilities)]
-        sorted_probs = sorted(sorted_probs)
-
-        num_uncertain = int(np.ceil(self.amount_to_label / 2.0))
-        num_almost_labeled = self.amount_to_label - num_uncertain
-
-        # # First, get the most uncertain
-        selected = [x[2] for x in sorted_probs[:num_uncertain]]
-
-        # Now, get the labels and find out which has the fewest number of instances
-        labels = [x[1] for x in sorted_probs]
-        label_fewest = np.argsort(np.bincount(labels))[0]
-
-        # Reduce to unselected instanced not assigned to that label, sort by probability of that label and pick
-        # the ones with highest probability (almost classified as that label)
-        reduced = sorted_probs[len(selected):]
-        reduced = [x for x in reduced if x[1] != label_fewest]
-        reduced = sorted(reduced, key=lambda x: x[3 + label_fewest], reverse=True)
-        selected = selected + [x[2] for x in reduced[:num_almost_labeled]]
-
-        return selected
+        self._fit()
+
+        # Let the query strategy choose among the candidates kept while scoring the test data. Labels that were
+        # never predicted are left out of the counts past the last one that was.
+        rows = self._candidates
+        counts = self._label_counts[:np.max(np.flatnonzero(self._label_counts), initial=-1) + 1]
+        features = labeled_features = None
+        if self.query_strategy.uses_features:
+            features, labeled_features = self.features[rows], self.features[self.labeled_mask]
+        disagreement = self._candidate_disagreement if isinstance(self.model, Committee) else None
+        with timing.timer("model.select"):
+            return list(self.query_strategy.select(self._candidate_proba, self.filenames[rows],
+                                                   self.amount_to_label, features, labeled_features, counts,
+                                                   disagreement))
 
     def get_labeled_training(self):
         return tuple(zip(*self.labeled_flights.items()))
 
+    @_synchronized
+    @timing.timed("model.get_labeled_test")
     def get_labeled_test(self, sorted=True, reverse=True):
-        # Create version of data with the labels given by user
-        data_with_labels = self.data.copy()
-
-        # Add labels to the data
-        data_with_labels["label"] = -1
-        for filename, label in self.labeled_flights.items():
-            data_with_labels.loc[data_with_labels["filename"] == filename, "label"] = label
-
-        # Separate into training and test
-        train = data_with_labels.loc[data_with_labels["filename"].isin(self.labeled_flights.keys())].copy()
-        train_labels = train["label"]
-        train.drop(["label", "filename"], axis=1, inplace=True)
-        test = data_with_labels.loc[~data_with_labels["filename"].isin(self.labeled_flights.keys())].copy()
-        test_filenames = np.asarray(test["filename"])
-        test.drop(["label", "filename"], axis=1, inplace=True)
-
-        # Train model with the new labeled data
-        self.model.fit(train, train_labels)
-        test_labels = self.model.predict(test)
-        test_proba = self.model.predict_proba(test)
-        test_proba = [max(p) for p in test_proba]
+        self._fit()
+
+        test = ~self.labeled_mask
+        test_filenames = self.filenames[test]
+        test_labels = self._predicted[test]
+        test_proba = self._confidence[test]
         order = np.argsort(test_proba)
         if reverse:
             order = order[::-1]
@@ -205,14 +584,24 @@ class ActiveLearning(object):
             test_labels = test_labels[order]
 
         if self.validation is not None:
-            val_data = self.validation.drop(["filename", "label"], axis=1)
-            true_lbls = self.validation["label"].astype(int)
-            pred_lbls = self.model.predict(val_data)
+            true_lbls = self.validation_labels
+            pred_lbls = self._validation_predicted
             # print(f1_score(true_lbls, pred_lbls, average="macro"))
             print(confusion_matrix(true_lbls, pred_lbls))
 
         return test_filenames, test_labels
 
+    @_synchronized
+    @timing.timed("model.get_validation_score")
+    def get_validation_score(self):
+        # Macro F1 of the model on the validation flights, None without validation
+        if self.validation is None:
+            return None
+        self._fit()
+        return f1_score(self.validation_labels, self._validation_predicted, average="macro")
+
+    @_synchronized
+    @timing.timed("model.get_label_distribution")
     def get_label_distribution(self):
         _, test_labels = self.get_labeled_test()
         _, training_labels = self.get_labeled_training()
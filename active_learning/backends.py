@@ -0,0 +1,122 @@
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.base import BaseEstimator, ClassifierMixin
+from sklearn.linear_model import LogisticRegression, SGDClassifier
+from sklearn.metrics import f1_score
+from sklearn.multiclass import OneVsRestClassifier
+
+# Labeled flights the backends are fitted on by choose_backend, and rows of the pool timed when predicting
+SAMPLE_SIZE = 5000
+PREDICT_SIZE = 65536
+
+# A backend within this macro F1 of the best one is as good
+TOLERANCE = .02
+
+# Labeled flights needed before the backends are compared, with fewer their timings and scores are noise
+MIN_LABELED = 100
+
+
+class NearestCentroidClassifier(BaseEstimator, ClassifierMixin):
+    # Mean of the features of every label. The probabilities are a softmax of the negative squared distances to the
+    # means, divided by temperature.
+    def __init__(self, temperature=1.):
+        self.temperature = temperature
+
+    def fit(self, features, labels):
+        labels = np.asarray(labels)
+        self.classes_ = np.unique(labels)
+        self.centroids_ = np.array([np.mean(features[labels == label], axis=0) for label in self.classes_])
+        return self
+
+    def predict_proba(self, features):
+        features = np.asarray(features, dtype=np.float64)
+        distances = (np.einsum("ij,ij->i", features, features)[:, None] - 2 * np.dot(features, self.centroids_.T) +
+                     np.einsum("ij,ij->i", self.centroids_, self.centroids_)[None, :])
+        logits = -distances / self.temperature
+        logits -= logits.max(axis=1, keepdims=True)
+        proba = np.exp(logits)
+        return proba / proba.sum(axis=1, keepdims=True)
+
+    def predict(self, features):
+        return self.classes_[np.argmax(self.predict_proba(features), axis=1)]
+
+
+def lbfgs():
+    # Multinomial logistic regression, a single problem so it runs on one core
+    return LogisticRegression(
+        C=.01,
+        class_weight="balanced",
+        random_state=None,
+        warm_start=False,
+        fit_intercept=True
+    )
+
+
+def liblinear():
+    # One binary logistic regression per label, fitted in parallel
+    return OneVsRestClassifier(LogisticRegression(C=.01, class_weight="balanced", solver="liblinear", fit_intercept=True),
+                               n_jobs=-1)
+
+
+def sgd():
+    # Online logistic regression, the only backend that can be trained incrementally
+    return SGDClassifier(
+        loss="log_loss",
+        alpha=.01,
+        random_state=None,
+        fit_intercept=True
+    )
+
+
+def nearest_centroid():
+    return NearestCentroidClassifier()
+
+
+BACKENDS = {
+    "lbfgs": lbfgs,
+    "liblinear": liblinear,
+    "sgd": sgd,
+    "nearest_centroid": nearest_centroid,
+}
+
+
+def make_backend(name):
+    try:
+        return BACKENDS[name]()
+    except KeyError:
+        raise ValueError("Unknown backend '{}', expected one of {}".format(name, sorted(BACKENDS) + ["auto"]))
+
+
+def benchmark_backends(features, labels, validation_features, validation_labels, pool=None, random_state=26):
+    # Fit time on up to SAMPLE_SIZE of the labeled flights, time to score the whole pool (estimated from
+    # PREDICT_SIZE rows of it, pool defaults to features) and macro F1 on the validation flights of every backend
+    if pool is None:
+        pool = features
+    rng = np.random.RandomState(random_state)
+    train = np.sort(rng.permutation(len(features))[:SAMPLE_SIZE])
+    predict_rows = min(PREDICT_SIZE, len(pool))
+
+    results = []
+    for name in sorted(BACKENDS):
+        model = make_backend(name)
+        start = time.perf_counter()
+        model.fit(features[train], labels[train])
+        fit = time.perf_counter() - start
+
+        start = time.perf_counter()
+        model.predict_proba(pool[:predict_rows])
+        predict = (time.perf_counter() - start) * len(pool) / float(predict_rows)
+
+        f1 = f1_score(validation_labels, model.predict(validation_features), average="macro")
+        results.append({"backend": name, "fit": fit, "predict": predict, "f1": f1})
+
+    return pd.DataFrame(results, columns=["backend", "fit", "predict", "f1"])
+
+
+def choose_backend(features, labels, validation_features, validation_labels, pool=None, tolerance=TOLERANCE):
+    # The fastest backend, fit plus scoring, among those within tolerance of the best macro F1 on validation
+    results = benchmark_backends(features, labels, validation_features, validation_labels, pool)
+    good = results[results["f1"] >= results["f1"].max() - tolerance]
+    return good.loc[(good["fit"] + good["predict"]).idxmin(), "backend"], results
@@ -0,0 +1,93 @@
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.base import BaseEstimator, ClassifierMixin, clone
+
+# How much the members of a committee disagree on a flight
+DISAGREEMENTS = ["vote_entropy", "kl"]
+
+# Attempts to draw a bootstrap sample that has every label
+BOOTSTRAP_TRIES = 10
+
+
+def _fit_member(model, features, labels, rows):
+    # Runs in a worker process. Features above joblib's max_nbytes are memory-mapped by the pool, so the workers
+    # share one copy of them and only the rows of the sample are gathered in each worker.
+    if rows is not None:
+        features, labels = features[rows], labels[rows]
+    return model.fit(features, labels)
+
+
+class Committee(BaseEstimator, ClassifierMixin):
+    # n_members copies of estimator trained in parallel, each on a bootstrap sample of the labeled flights and,
+    # when Cs is given, with the regularization Cs[i % len(Cs)]. The probabilities are the mean of the members and
+    # disagreement measures how much they differ, by the entropy of their votes or by the mean KL divergence of
+    # each member from the mean.
+    def __init__(self, estimator, n_members=5, bootstrap=True, Cs=None, disagreement="vote_entropy", n_jobs=-1,
+                 random_state=26):
+        self.estimator = estimator
+        self.n_members = n_members
+        self.bootstrap = bootstrap
+        self.Cs = Cs
+        self.disagreement = disagreement
+        self.n_jobs = n_jobs
+        self.random_state = random_state
+
+    def fit(self, features, labels):
+        if self.disagreement not in DISAGREEMENTS:
+            raise ValueError("Unknown disagreement '{}', expected one of {}".format(self.disagreement, DISAGREEMENTS))
+
+        labels = np.asarray(labels)
+        self.classes_ = np.unique(labels)
+        rng = np.random.RandomState(self.random_state)
+
+        members, samples = [], []
+        for i in range(self.n_members):
+            model = clone(self.estimator)
+            if self.Cs is not None:
+                model.set_params(C=self.Cs[i % len(self.Cs)])
+            members.append(model)
+            samples.append(self._sample(labels, rng) if self.bootstrap else None)
+
+        # The members use a single core each, the committee spreads them over the cores
+        for model in members:
+            if "n_jobs" in model.get_params():
+                model.set_params(n_jobs=1)
+
+        self.members_ = Parallel(n_jobs=self.n_jobs, backend="loky")(
+            delayed(_fit_member)(model, features, labels, rows) for model, rows in zip(members, samples))
+        return self
+
+    def _sample(self, labels, rng):
+        # A bootstrap sample with every label, or every row when none is drawn
+        for _ in range(BOOTSTRAP_TRIES):
+            rows = rng.randint(len(labels), size=len(labels))
+            if len(np.unique(labels[rows])) == len(self.classes_):
+                return rows
+        return None
+
+    def _member_proba(self, features):
+        # Probabilities of every member, with the columns of the labels of the committee
+        proba = np.zeros((len(self.members_), len(features), len(self.classes_)))
+        for i, model in enumerate(self.members_):
+            proba[i][:, np.searchsorted(self.classes_, model.classes_)] = model.predict_proba(features)
+        return proba
+
+    def predict_proba_disagreement(self, features):
+        proba = self._member_proba(features)
+        mean = proba.mean(axis=0)
+
+        if self.disagreement == "vote_entropy":
+            votes = np.argmax(proba, axis=2)
+            shares = np.stack([(votes == c).mean(axis=0) for c in range(len(self.classes_))], axis=1)
+            disagreement = -np.sum(shares * np.log(np.where(shares > 0, shares, 1)), axis=1)
+        else:
+            ratio = np.clip(proba, 1e-12, 1) / np.clip(mean, 1e-12, 1)
+            disagreement = np.mean(np.sum(proba * np.log(ratio), axis=2), axis=0)
+
+        return mean, disagreement
+
+    def predict_proba(self, features):
+        return self._member_proba(features).mean(axis=0)
+
+    def predict(self, features):
+        return self.classes_[np.argmax(self.predict_proba(features), axis=1)]
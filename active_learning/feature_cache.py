@@ -0,0 +1,189 @@
+import hashlib
+import json
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from active_learning.reduction import fit_reduction, reduce_features
+
+# Bump when the transform below changes, caches written by another version are rebuilt
+TRANSFORM_VERSION = "exp(-scale)/float32/1"
+
+# Bytes hashed at a time, and rows copied at a time by store_pool
+HASH_BLOCK = 1024 ** 2
+CHUNK_SIZE = 65536
+
+
+class FeatureMatrix(object):
+    # The transformed features of a feature file: names of the columns, matrix (flights, features), base name of the
+    # flight of every row, initial cluster labels and the statistics the transform used. fingerprint identifies the
+    # content of the feature file and the transform. With a reduction, features are the reduced features and
+    # reduction is what reduces the transformed features of the columns in names.
+    def __init__(self, names, features, basenames, labels, mean, std, fingerprint, reduction=None):
+        self.names = names
+        self.features = features
+        self.basenames = basenames
+        self.labels = labels
+        self.mean = mean
+        self.std = std
+        self.fingerprint = fingerprint
+        self.reduction = reduction
+
+
+def cache_dir(feature_file):
+    return os.path.expanduser(feature_file) + ".cache"
+
+
+def file_hash(path):
+    sha = hashlib.sha1()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(HASH_BLOCK), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def load_features(feature_file, reduction=None, n_components=None):
+    # Reads the transformed features from the cache of the feature file, memory-mapped, and builds the cache first
+    # when it is missing or was made from another version of the file or of the transform. reduction, one of
+    # active_learning.reduction.REDUCTIONS, brings them down to n_components columns; the reduced features are
+    # cached as well.
+    matrix = _load_transformed(os.path.expanduser(feature_file))
+    if reduction is None:
+        return matrix
+
+    directory = cache_dir(feature_file)
+    name = "{}-{}".format(reduction, n_components)
+    path = os.path.join(directory, "reduced-{}.npy".format(name))
+    model_path = os.path.join(directory, "reduction-{}.pkl".format(name))
+
+    if os.path.exists(path) and os.path.exists(model_path):
+        with open(model_path, "rb") as fh:
+            model = pickle.load(fh)
+    else:
+        model = fit_reduction(matrix.features, reduction, n_components)
+        with open(model_path + ".tmp", "wb") as fh:
+            pickle.dump(model, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(model_path + ".tmp", model_path)
+
+        # The reduced features are written last, the reduction is only read back once they exist
+        with open(path + ".tmp", "wb") as fh:
+            np.save(fh, reduce_features(model, matrix.features))
+        os.replace(path + ".tmp", path)
+
+    return FeatureMatrix(matrix.names, np.load(path, mmap_mode="r"), matrix.basenames, matrix.labels, matrix.mean,
+                         matrix.std, "{}:{}".format(matrix.fingerprint, name), model)
+
+
+def store_pool(feature_file, key, features, rows, extra=None):
+    # Writes the rows of features, followed by the rows of extra, to the cache of the feature file chunk by chunk and
+    # returns them memory-mapped, so a pool taken out of the cached features is never held in memory. key names the
+    # pool, one already written under it is read back as is, and the pools written before are removed.
+    extra = features[:0] if extra is None else extra
+    if len(rows) + len(extra) == 0:
+        # An empty file can not be mapped
+        return np.concatenate([features[rows], extra])
+
+    path = os.path.join(cache_dir(feature_file), "pool-{}.npy".format(key))
+    try:
+        if not os.path.exists(path):
+            pool = np.lib.format.open_memmap(path + ".tmp", mode="w+", dtype=features.dtype,
+                                             shape=(len(rows) + len(extra),) + features.shape[1:])
+            for start in range(0, len(rows), CHUNK_SIZE):
+                chunk = rows[start:start + CHUNK_SIZE]
+                pool[start:start + len(chunk)] = features[chunk]
+            pool[len(rows):] = extra
+            pool.flush()
+            del pool
+            os.replace(path + ".tmp", path)
+
+            for name in os.listdir(cache_dir(feature_file)):
+                if name.startswith("pool-") and name != os.path.basename(path):
+                    try:
+                        os.remove(os.path.join(cache_dir(feature_file), name))
+                    except OSError:
+                        # Still mapped on a platform that can not remove it, removed with the next pool
+                        pass
+        return np.load(path, mmap_mode="r")
+    except OSError:
+        # Read-only location, the pool is kept in memory
+        return np.concatenate([features[rows], extra])
+
+
+def _load_transformed(feature_file):
+    directory = cache_dir(feature_file)
+    meta = _read_meta(directory)
+
+    stat = os.stat(feature_file)
+    valid = meta is not None and meta["transform"] == TRANSFORM_VERSION
+    if valid and (meta["size"], meta["mtime"]) != (stat.st_size, stat.st_mtime):
+        # The file was touched or replaced, only its content tells whether the cache still holds
+        valid = meta["sha1"] == file_hash(feature_file)
+        if valid:
+            meta.update(size=stat.st_size, mtime=stat.st_mtime)
+            _write_meta(directory, meta)
+
+    if not valid:
+        return _build(feature_file, directory, stat)
+
+    return FeatureMatrix(meta["names"],
+                         np.load(os.path.join(directory, "features.npy"), mmap_mode="r"),
+                         np.load(os.path.join(directory, "basenames.npy"), mmap_mode="r"),
+                         np.load(os.path.join(directory, "labels.npy")),
+                         np.array(meta["mean"]), np.array(meta["std"]),
+                         "{}:{}".format(meta["transform"], meta["sha1"]))
+
+
+def _build(feature_file, directory, stat):
+    # A cache without meta.json is never read, even if the build stops half way. Whatever else was derived from
+    # the previous features is dropped too.
+    if os.path.isdir(directory):
+        if os.path.exists(os.path.join(directory, "meta.json")):
+            os.remove(os.path.join(directory, "meta.json"))
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+
+    data = pd.read_csv(feature_file, engine="c")
+    names = list(data.columns[:-2])
+
+    # Flights are known by the base name of their file, the first row of a flight wins
+    basenames = data["filename"].astype(str).str.replace(r"^.*[/\\]", "", regex=True).to_numpy().astype(str)
+    _, first = np.unique(basenames, return_index=True)
+    keep = np.sort(first)
+
+    # Same as scale followed by exp(-x), in one pass over the whole matrix. The statistics are those of every row
+    # of the file, duplicates included.
+    features = data[names].to_numpy(dtype=np.float64)
+    mean = features.mean(axis=0)
+    std = features.std(axis=0)
+    std[std == 0] = 1
+    features = np.exp(-(features[keep] - mean) / std).astype(np.float32)
+    labels = data["label"].to_numpy()[keep].astype(int)
+    basenames = basenames[keep]
+
+    os.makedirs(directory, exist_ok=True)
+    np.save(os.path.join(directory, "features.npy"), features)
+    np.save(os.path.join(directory, "basenames.npy"), basenames)
+    np.save(os.path.join(directory, "labels.npy"), labels)
+
+    # Written last, a cache without it is rebuilt
+    _write_meta(directory, {"transform": TRANSFORM_VERSION, "sha1": file_hash(feature_file), "size": stat.st_size,
+                            "mtime": stat.st_mtime, "names": names, "mean": mean.tolist(), "std": std.tolist()})
+
+    return _load_transformed(feature_file)
+
+
+def _read_meta(directory):
+    try:
+        with open(os.path.join(directory, "meta.json")) as fh:
+            return json.load(fh)
+    except (IOError, ValueError):
+        return None
+
+
+def _write_meta(directory, meta):
+    path = os.path.join(directory, "meta.json")
+    with open(path + ".tmp", "w") as fh:
+        json.dump(meta, fh)
+    os.replace(path + ".tmp", path)
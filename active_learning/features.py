@@ -0,0 +1,288 @@
+import argparse
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from sklearn.cluster import KMeans
+from sklearn.preprocessing import scale
+
+from util.util import load_flight
+
+# Channel the distances are computed on
+CHANNEL = "AltGPS"
+
+
+def resample(values, length):
+    # Every series is brought to the same length, which the band and LB_Keogh rely on
+    values = np.asarray(values, dtype=np.float64)
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        return np.zeros(length)
+    return np.interp(np.linspace(0, len(values) - 1, length), np.arange(len(values)), values)
+
+
+def envelope(series, window):
+    # Upper and lower envelope of each row of series for LB_Keogh
+    padded = np.pad(series, ((0, 0), (window, window)), mode="edge")
+    view = sliding_window_view(padded, 2 * window + 1, axis=1)
+    return view.max(axis=2), view.min(axis=2)
+
+
+def lb_kim(query, references):
+    # Every warping path matches the first and the last points
+    return np.abs(query[0] - references[:, 0]) + np.abs(query[-1] - references[:, -1])
+
+
+def lb_keogh(query, upper, lower):
+    return np.sum(np.maximum(query - upper, 0) + np.maximum(lower - query, 0), axis=1)
+
+
+def dtw(queries, references, window, max_distance=np.inf):
+    # DTW with absolute differences and a Sakoe-Chiba band between each row of queries and the same row of
+    # references, computed for all the pairs at once. Row i of the cost matrix is stored relative to its band: k
+    # stands for column i - window + k. Within a row D[k] = c[k] + min(a[k], D[k-1]), with a[k] the best of the two
+    # cells above, which unrolls to a cumulative sum plus a running minimum. Pairs whose row minimum passes
+    # max_distance can not come back under it and are abandoned, their distance is reported as max_distance.
+    length = queries.shape[1]
+    width = 2 * window + 1
+    distances = np.full(len(queries), max_distance, dtype=np.float64)
+
+    active = np.arange(len(queries))
+    previous = None
+    for i in range(length):
+        # Band positions [lo, hi) fall inside the matrix
+        lo, hi = max(0, window - i), min(width, length - i + window)
+
+        cost = np.zeros((len(active), width))
+        cost[:, lo:hi] = np.abs(queries[:, i:i + 1] - references[:, i - window + lo:i - window + hi])
+
+        if previous is None:
+            above = np.full((len(active), width), np.inf)
+            above[:, window] = 0
+        else:
+            shifted = np.full_like(previous, np.inf)
+            shifted[:, :-1] = previous[:, 1:]
+            above = np.minimum(previous, shifted)
+            above[:, :lo] = np.inf
+            above[:, hi:] = np.inf
+
+        cumulative = np.cumsum(cost, axis=1)
+        before = np.zeros_like(cumulative)
+        before[:, 1:] = cumulative[:, :-1]
+        current = cumulative + np.minimum.accumulate(above - before, axis=1)
+        current[:, :lo] = np.inf
+        current[:, hi:] = np.inf
+
+        # Early abandoning, every path goes through this row
+        keep = current.min(axis=1) <= max_distance
+        if not np.all(keep):
+            active, current = active[keep], current[keep]
+            queries, references = queries[keep], references[keep]
+            if len(active) == 0:
+                return distances
+        previous = current
+
+    distances[active] = np.minimum(previous[:, window], max_distance)
+    return distances
+
+
+def flight_distances(queries, references, upper, lower, window, max_distance=np.inf):
+    # Distances from each flight in queries to all the references, shape (queries, references). With a finite
+    # max_distance the pairs that LB_Kim or LB_Keogh already place beyond it are skipped.
+    distances = np.full((len(queries), len(references)), max_distance, dtype=np.float64)
+    pairs = []
+    for q, query in enumerate(queries):
+        candidates = np.arange(len(references))
+        if np.isfinite(max_distance):
+            candidates = candidates[lb_kim(query, references) <= max_distance]
+            candidates = candidates[lb_keogh(query, upper[candidates], lower[candidates]) <= max_distance]
+        pairs.append(np.stack([np.full(len(candidates), q), candidates], axis=1))
+
+    pairs = np.concatenate(pairs)
+    if len(pairs):
+        distances[pairs[:, 0], pairs[:, 1]] = dtw(queries[pairs[:, 0]], references[pairs[:, 1]], window, max_distance)
+    return distances
+
+
+# State of the worker processes, set once by _init_worker
+_worker = {}
+
+
+def _init_worker(references, window, length, max_distance):
+    upper, lower = envelope(references, window)
+    _worker.update(references=references, upper=upper, lower=lower, window=window, length=length,
+                   max_distance=max_distance)
+
+
+def _compute_chunk(file_names):
+    # The flights of a chunk go through DTW together, which spreads the cost of every numpy call over more pairs
+    names, queries = [], []
+    for file_name in file_names:
+        try:
+            queries.append(resample(load_flight(file_name)[CHANNEL], _worker["length"]))
+        except Exception:
+            continue
+        names.append(file_name)
+
+    if not names:
+        return []
+    distances = flight_distances(np.array(queries), _worker["references"], _worker["upper"], _worker["lower"],
+                                 _worker["window"], _worker["max_distance"])
+    return list(zip(names, distances))
+
+
+def list_flights(data_dir):
+    data_dir = os.path.expanduser(data_dir)
+    return [os.path.join(data_dir, fn) for fn in sorted(os.listdir(data_dir)) if fn.lower().endswith(".csv")]
+
+
+def compute_features(file_names, references, length=256, band=.1, max_distance=None, workers=None, chunk_size=64):
+    # DTW distance of every flight to every reference flight, spread over a pool of processes. Returns the file
+    # names that could be read and their distances as an array of shape (flights, references).
+    window = max(1, int(round(band * length)))
+    max_distance = np.inf if max_distance is None else float(max_distance)
+    reference_series = np.array([resample(load_flight(fn)[CHANNEL], length) for fn in references])
+
+    chunks = [file_names[i:i + chunk_size] for i in range(0, len(file_names), chunk_size)]
+    initargs = (reference_series, window, length, max_distance)
+    if workers == 1:
+        _init_worker(*initargs)
+        results = map(_compute_chunk, chunks)
+    else:
+        # Spawned workers do not inherit the threads of the parent, which the flight loader uses
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=_init_worker, initargs=initargs)
+        results = pool.map(_compute_chunk, chunks)
+
+    names, distances = [], []
+    for rows in results:
+        for file_name, row in rows:
+            names.append(file_name)
+            distances.append(row)
+
+    if workers != 1:
+        pool.shutdown()
+
+    return names, np.array(distances).reshape(len(names), len(references))
+
+
+def transform(distances, mean, std):
+    # The transform ActiveLearning applies to the features, with the statistics of the whole feature file
+    return np.exp(-(distances - mean) / std)
+
+
+def feature_stats(distances, labels):
+    # Mean and standard deviation of every column (a constant column is left unscaled, like sklearn's scale does)
+    # and the center of every cluster in transformed space, used to place the flights added later
+    mean = distances.mean(axis=0)
+    std = distances.std(axis=0)
+    std[std == 0] = 1
+    transformed = transform(distances, mean, std)
+    centers = np.array([transformed[labels == label].mean(axis=0) for label in np.unique(labels)])
+    return mean, std, np.unique(labels), centers
+
+
+def _stats_file(feature_file):
+    return os.path.expanduser(feature_file) + ".stats.npz"
+
+
+def cluster_labels(distances, n_clusters, random_state=26):
+    # Initial clusters for the label column, found on the same transform ActiveLearning applies to the features
+    transformed = np.exp(-scale(distances))
+    return KMeans(n_clusters=n_clusters, n_init=10, random_state=random_state).fit_predict(transformed)
+
+
+def build_features(data_dir, output, n_references=100, references=None, n_clusters=3, random_state=26, **kwargs):
+    # Writes the feature file read by ActiveLearning: one column per reference flight, then label and filename
+    file_names = list_flights(data_dir)
+    if references is None:
+        rng = np.random.RandomState(random_state)
+        references = sorted(rng.choice(file_names, size=min(n_references, len(file_names)), replace=False))
+
+    names, distances = compute_features(file_names, references, **kwargs)
+
+    data = pd.DataFrame(distances, columns=[os.path.basename(fn) for fn in references])
+    data["label"] = cluster_labels(distances, n_clusters, random_state)
+    data["filename"] = names
+    data.to_csv(os.path.expanduser(output), index=False)
+
+    # Kept next to the feature file for update_features
+    params = {key: kwargs[key] for key in ("length", "band", "max_distance") if kwargs.get(key) is not None}
+    mean, std, labels, centers = feature_stats(distances, data["label"].to_numpy())
+    np.savez(_stats_file(output), mean=mean, std=std, labels=labels, centers=centers, **params)
+
+    return data
+
+
+def update_features(data_dir, feature_file, **kwargs):
+    # Appends to the feature file the flights of data_dir it does not have yet, the flights already in it are not
+    # computed again. New flights go to the cluster with the nearest center. Returns the appended rows, which can
+    # be passed to ActiveLearning.add_flights.
+    feature_file = os.path.expanduser(feature_file)
+    columns = list(pd.read_csv(feature_file, nrows=0).columns)
+    references = [os.path.join(os.path.expanduser(data_dir), name) for name in columns[:-2]]
+
+    known = set(os.path.basename(fn) for fn in pd.read_csv(feature_file, usecols=["filename"])["filename"])
+    missing = [fn for fn in list_flights(data_dir) if os.path.basename(fn) not in known]
+
+    if os.path.exists(_stats_file(feature_file)):
+        stats = np.load(_stats_file(feature_file))
+        mean, std, labels, centers = stats["mean"], stats["std"], stats["labels"], stats["centers"]
+        # Distances must be computed as when the file was built
+        for key in ("length", "band", "max_distance"):
+            if key in stats and key not in kwargs:
+                kwargs[key] = stats[key].item()
+    else:
+        # Feature files built elsewhere, the statistics are computed once from the whole file
+        data = pd.read_csv(feature_file)
+        mean, std, labels, centers = feature_stats(data[columns[:-2]].to_numpy(), data["label"].to_numpy())
+        np.savez(_stats_file(feature_file), mean=mean, std=std, labels=labels, centers=centers)
+
+    if not missing:
+        return pd.DataFrame(columns=columns)
+
+    names, distances = compute_features(missing, references, **kwargs)
+
+    transformed = transform(distances, mean, std)
+    nearest = np.argmin(((transformed[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2), axis=1)
+
+    data = pd.DataFrame(distances, columns=columns[:-2])
+    data["label"] = labels[nearest]
+    data["filename"] = names
+    data.to_csv(feature_file, mode="a", header=False, index=False)
+
+    return data
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build the DTW feature file used by ActiveLearning")
+    parser.add_argument("data_dir", help="Directory with the flight CSV files")
+    parser.add_argument("output", help="Feature file to write")
+    parser.add_argument("--references", type=int, default=100, help="Number of reference flights")
+    parser.add_argument("--clusters", type=int, default=3, help="Number of clusters for the label column")
+    parser.add_argument("--length", type=int, default=256, help="Length every series is resampled to")
+    parser.add_argument("--band", type=float, default=.1, help="Width of the warping band, as a fraction of length")
+    parser.add_argument("--max-distance", type=float, default=None,
+                        help="Distances above this are stored as this value, enables lower bound pruning")
+    parser.add_argument("--workers", type=int, default=None, help="Number of processes (default: all cores)")
+    parser.add_argument("--update", action="store_true",
+                        help="Only append the flights missing from an existing feature file")
+    args = parser.parse_args()
+
+    start = time.time()
+    if args.update:
+        # The options the file was built with are reused unless given
+        options = {key: value for key, value in (("length", args.length), ("band", args.band),
+                                                 ("max_distance", args.max_distance))
+                   if value is not None and value != parser.get_default(key)}
+        data = update_features(args.data_dir, args.output, workers=args.workers, **options)
+    else:
+        data = build_features(args.data_dir, args.output, n_references=args.references, n_clusters=args.clusters,
+                              length=args.length, band=args.band, max_distance=args.max_distance,
+                              workers=args.workers)
+    elapsed = time.time() - start
+    print("{} flights in {:.1f} s ({:.1f} flights/s)".format(len(data), elapsed, len(data) / max(elapsed, 1e-9)))
@@ -0,0 +1,110 @@
+import json
+import os
+
+# The journal is compacted once it holds this many times more entries than there are labels
+COMPACT_FACTOR = 2
+
+# Journals smaller than this are never compacted
+COMPACT_MIN = 1024
+
+
+class LabelJournal(object):
+    # Append-only record of the labels, one JSON line per change, synced to disk before returning. A line is either
+    # a batch of new labels {"labels": [[flight, label], ...]} or the whole state {"reset": {...}, "names": [...]},
+    # written when the labels are replaced at once. Flights are stored by base name.
+    def __init__(self, path):
+        self.path = os.path.expanduser(path)
+        self.names, self.labels = None, {}
+        self.entries = 0
+        self.replay()
+        self._fh = open(self.path, "a")
+
+    def replay(self):
+        # Label names (None when never recorded) and labels stored in the journal
+        self.names, self.labels = None, {}
+        self.entries = 0
+        if not os.path.exists(self.path):
+            return self.names, dict(self.labels)
+
+        valid = 0
+        with open(self.path, "rb") as fh:
+            for line in fh:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("Incomplete line")
+                    record = json.loads(line.decode("utf-8"))
+                except ValueError:
+                    # Last line cut by a crash while it was written, the batch was never acknowledged
+                    break
+                valid += len(line)
+                if "reset" in record:
+                    self.labels = dict(record["reset"])
+                    self.names = record.get("names", self.names)
+                    self.entries += len(self.labels)
+                else:
+                    self.labels.update(record["labels"])
+                    self.entries += len(record["labels"])
+
+        # Later lines are appended after the last complete one
+        if valid < os.path.getsize(self.path):
+            with open(self.path, "r+b") as fh:
+                fh.truncate(valid)
+
+        return self.names, dict(self.labels)
+
+    def append(self, new_labels):
+        new_labels = [[os.path.basename(flight), int(label)] for flight, label in new_labels]
+        self._write({"labels": new_labels})
+        self.labels.update(new_labels)
+        self.entries += len(new_labels)
+
+        # Compacting only when the journal doubles keeps the cost per label constant on average
+        if self.entries > COMPACT_FACTOR * max(len(self.labels), COMPACT_MIN):
+            self.compact()
+
+    def reset(self, labels, names):
+        self.labels = {os.path.basename(flight): int(label) for flight, label in labels.items()}
+        self.names = list(names)
+        self._write(self._state())
+        self.entries += len(self.labels)
+
+    def compact(self):
+        # The state is written to a new file that replaces the journal, a crash leaves either of the two intact
+        self._fh.close()
+        with open(self.path + ".tmp", "w") as fh:
+            fh.write(json.dumps(self._state()) + "\n")
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(self.path + ".tmp", self.path)
+        _sync_dir(os.path.dirname(os.path.abspath(self.path)))
+
+        self._fh = open(self.path, "a")
+        self.entries = len(self.labels)
+
+    def close(self):
+        self._fh.close()
+
+    def _state(self):
+        record = {"reset": self.labels}
+        if self.names is not None:
+            record["names"] = self.names
+        return record
+
+    def _write(self, record):
+        self._fh.write(json.dumps(record) + "\n")
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+
+
+def _sync_dir(directory):
+    # Makes the rename durable, not available on every platform
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
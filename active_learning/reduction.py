@@ -0,0 +1,58 @@
+import numpy as np
+from sklearn.kernel_approximation import Nystroem
+from sklearn.random_projection import GaussianRandomProjection
+
+from active_learning.strategies import min_distances
+
+# Rows the reductions are fitted on, and rows transformed at a time
+SAMPLE_SIZE = 10000
+CHUNK_SIZE = 65536
+
+
+class LandmarkReduction(object):
+    # Keeps n_components of the columns, that is of the reference flights. Greedy k-center over the columns picks
+    # references that are far from each other, starting from the column with the largest variance.
+    def __init__(self, n_components):
+        self.n_components = n_components
+        self.columns_ = None
+
+    def fit(self, features):
+        points = np.asarray(features, dtype=np.float64).T
+        distances = np.full(len(points), np.inf)
+        columns = [int(np.argmax(points.var(axis=1)))]
+        while len(columns) < min(self.n_components, len(points)):
+            distances = np.minimum(distances, min_distances(points, points[columns[-1]:columns[-1] + 1]))
+            distances[columns] = -1
+            columns.append(int(np.argmax(distances)))
+        self.columns_ = np.array(sorted(columns))
+        return self
+
+    def transform(self, features):
+        return features[:, self.columns_]
+
+
+def make_reduction(method, n_components, random_state=26):
+    if method == "landmarks":
+        return LandmarkReduction(n_components)
+    if method == "nystroem":
+        return Nystroem(kernel="rbf", n_components=n_components, random_state=random_state)
+    if method == "random":
+        return GaussianRandomProjection(n_components=n_components, random_state=random_state)
+    raise ValueError("Unknown reduction '{}', expected one of {}".format(method, REDUCTIONS))
+
+
+REDUCTIONS = ["landmarks", "nystroem", "random"]
+
+
+def fit_reduction(features, method, n_components, random_state=26):
+    # Fitted on a sample of the rows, a fixed number of them is enough to place the components
+    rng = np.random.RandomState(random_state)
+    sample = np.sort(rng.choice(len(features), size=min(SAMPLE_SIZE, len(features)), replace=False))
+    return make_reduction(method, n_components, random_state).fit(np.asarray(features[sample], dtype=np.float64))
+
+
+def reduce_features(reduction, features):
+    # Transforms the rows chunk by chunk, features may be memory-mapped
+    reduced = [reduction.transform(np.asarray(features[start:start + CHUNK_SIZE], dtype=np.float64))
+               for start in range(0, len(features), CHUNK_SIZE)]
+    return np.concatenate(reduced).astype(np.float32)
@@ -0,0 +1,140 @@
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from active_learning.active_learning import ActiveLearning
+
+# Phases timed every round, fit is the training of the model and query the scoring of the pool and the selection
+PHASES = ["fit", "query", "evaluate", "label"]
+
+
+def synthetic_features(directory, n_flights, n_features=20, labels=("A", "B", "C"), n_validation=2000,
+                       noise=.3, random_state=26):
+    # Writes a feature file like the one of active_learning.features for n_flights made up flights, the labels of
+    # all of them (truth.csv) and a validation file with some of them. The label column of the feature file is the
+    # true label with a fraction `noise` of the flights moved to a random cluster, as an initial clustering would.
+    # Returns the paths of the three files.
+    rng = np.random.RandomState(random_state)
+    os.makedirs(directory, exist_ok=True)
+
+    truth = rng.randint(len(labels), size=n_flights)
+    centers = rng.uniform(50, 500, size=(len(labels), n_features))
+    distances = np.abs(centers[truth] + rng.normal(0, 200, size=(n_flights, n_features)))
+
+    clusters = truth.copy()
+    moved = rng.rand(n_flights) < noise
+    clusters[moved] = rng.randint(len(labels), size=moved.sum())
+
+    file_names = np.array(["flight_{:07d}.csv".format(i) for i in range(n_flights)], dtype=object)
+    names = np.array(labels, dtype=object)[truth]
+
+    data = pd.DataFrame(distances, columns=["ref_{:03d}.csv".format(i) for i in range(n_features)])
+    data["label"] = clusters
+    data["filename"] = file_names
+
+    paths = [os.path.join(directory, fn) for fn in ("features.csv", "truth.csv", "validation.csv")]
+    data.to_csv(paths[0], index=False, float_format="%.3f")
+    pd.DataFrame({"filename": file_names, "label": names}).to_csv(paths[1], index=False)
+
+    validation = rng.choice(n_flights, size=min(n_validation, n_flights), replace=False)
+    pd.DataFrame({"filename": file_names[validation], "label": names[validation]}).to_csv(paths[2], index=False)
+
+    return paths
+
+
+def load_oracle(filename, labels):
+    # Label index of every flight by base name, from a CSV with filename and label columns. Labels are either
+    # names in `labels` or indices, as in the label column of a feature file.
+    data = pd.read_csv(os.path.expanduser(filename), usecols=["filename", "label"])
+    index = {name: i for i, name in enumerate(labels)}
+    return {os.path.basename(fn): int(index.get(label, label)) for fn, label in zip(data["filename"], data["label"])}
+
+
+def simulate(model, oracle, rounds=10, on_round=None):
+    # Runs the labeling loop of the demo with the oracle answering instead of a person: the centroids are labeled
+    # first, then `rounds` batches of model.get_flights_to_label. Returns a DataFrame with a row per round with the
+    # time of every phase and the macro F1 on the validation flights of the model that chose the batch, trained
+    # on `labeled` flights. Flights the oracle does not know are taken out of the pool first.
+    def answer(flights):
+        return [(flight, oracle[os.path.basename(flight)]) for flight in flights]
+
+    known = [filename for filename in model.filenames if os.path.basename(filename) in oracle]
+    if not known:
+        raise ValueError("The oracle has none of the flights of the pool, the validation flights are not in the pool")
+    model.keep_flights(known)
+
+    records = []
+    start = time.perf_counter()
+    centroids = model.get_centroids()
+    model.restart()
+    model.label_flights(answer(centroids))
+    records.append({"round": 0, "labeled": 0, "centroids": time.perf_counter() - start})
+
+    for r in range(1, rounds + 1):
+        record = {"round": r}
+
+        fits = len(model.fit_times)
+        start = time.perf_counter()
+        flights = model.get_flights_to_label()
+        elapsed = time.perf_counter() - start
+        record["fit"] = model.fit_times[-1] if len(model.fit_times) > fits else 0.
+        record["query"] = elapsed - record["fit"]
+
+        # The model that chose the batch, trained on the flights labeled so far
+        start = time.perf_counter()
+        record["f1"] = model.get_validation_score()
+        record["evaluate"] = time.perf_counter() - start
+        record["labeled"] = len(model.labeled_flights)
+
+        start = time.perf_counter()
+        model.label_flights(answer(flights))
+        record["label"] = time.perf_counter() - start
+
+        records.append(record)
+        if on_round is not None:
+            on_round(record)
+
+    return pd.DataFrame(records, columns=["round", "labeled", "centroids"] + PHASES + ["f1"])
+
+
+def run(feature_file, oracle_file, validation_file=None, labels=None, rounds=10, **kwargs):
+    # Builds the model for a feature file and simulates a labeling session on it. Without label names, they are
+    # the labels found in the validation file, or else in the oracle file.
+    if labels is None:
+        source = oracle_file if validation_file is None else validation_file
+        labels = sorted(pd.read_csv(os.path.expanduser(source), usecols=["label"])["label"].unique())
+
+    model = ActiveLearning(labels=list(labels), feature_file=feature_file, data_dir="", **kwargs)
+    if validation_file is not None:
+        model.load_validation(validation_file)
+
+    return simulate(model, load_oracle(oracle_file, model.get_label_names()), rounds)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Simulate a labeling session without the user interface")
+    parser.add_argument("--features", help="Feature file")
+    parser.add_argument("--oracle", help="CSV with the label of every flight (default: label column of --features)")
+    parser.add_argument("--validation", help="CSV with the labels of the validation flights")
+    parser.add_argument("--synthetic", type=int, help="Simulate on this many made up flights instead")
+    parser.add_argument("--directory", default="simulation", help="Where the synthetic files are written")
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--amount", type=int, default=10, help="Flights labeled every round")
+    parser.add_argument("--strategy", default="default", help="Query strategy")
+    parser.add_argument("--incremental", action="store_true", help="Train the model online")
+    parser.add_argument("--output", help="CSV to write the rounds to")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        args.features, args.oracle, args.validation = synthetic_features(args.directory, args.synthetic)
+    elif args.features is None:
+        parser.error("either --features or --synthetic is needed")
+
+    result = run(args.features, args.oracle or args.features, args.validation, rounds=args.rounds,
+                 amount_to_label=args.amount, query_strategy=args.strategy, incremental=args.incremental)
+    print(result.to_string(index=False, float_format="{:.4f}".format))
+    if args.output:
+        result.to_csv(args.output, index=False)
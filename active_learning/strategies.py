@@ -0,0 +1,241 @@
+import numpy as np
+from sklearn.cluster import KMeans
+
+# Rows of the distance blocks, bounds the memory of the diversity strategies to BLOCK_SIZE x BLOCK_SIZE distances
+BLOCK_SIZE = 4096
+
+
+def smallest(keys, k, rows=None):
+    # Indices of the k rows that come first when sorting lexicographically by keys (primary key first). Only the
+    # rows tied with the k-th primary key are actually sorted, so this is O(N) for small k.
+    if rows is None:
+        rows = np.arange(len(keys[0]))
+    if k <= 0:
+        return rows[:0]
+    primary = keys[0][rows]
+    if k < len(rows):
+        threshold = np.partition(primary, k - 1)[k - 1]
+        rows = rows[primary <= threshold]
+    order = np.lexsort([key[rows] for key in reversed(keys)])
+    return rows[order[:k]]
+
+
+def select_flights(probabilities, file_names, amount_to_label, label_counts=None):
+    # label_counts, the number of flights predicted as each label, is counted from probabilities unless given
+    file_names = np.asarray(file_names)
+    max_proba = np.max(probabilities, axis=1)
+    predicted = np.argmax(probabilities, axis=1)
+    if label_counts is None:
+        label_counts = np.bincount(predicted)
+
+    num_uncertain = int(np.ceil(amount_to_label / 2.0))
+    num_almost_labeled = amount_to_label - num_uncertain
+
+    # First, get the most uncertain (ties are broken by predicted label and then by filename)
+    uncertain = smallest([max_proba, predicted, file_names], num_uncertain)
+
+    # Now, get the labels and find out which has the fewest number of instances
+    label_fewest = np.argsort(label_counts)[0]
+
+    # Reduce to unselected instanced not assigned to that label and pick the ones with highest probability of that
+    # label (almost classified as that label)
+    available = predicted != label_fewest
+    available[uncertain] = False
+    almost_labeled = smallest([-probabilities[:, label_fewest], max_proba, predicted, file_names],
+                              num_almost_labeled, np.flatnonzero(available))
+
+    return list(file_names[uncertain]) + list(file_names[almost_labeled])
+
+
+def margin(probabilities):
+    # Difference between the two most probable labels, small when the model hesitates between them
+    if probabilities.shape[1] < 2:
+        return probabilities[:, 0]
+    top = -np.partition(-probabilities, 1, axis=1)
+    return top[:, 0] - top[:, 1]
+
+
+def entropy(probabilities):
+    return -np.sum(probabilities * np.log(np.clip(probabilities, 1e-12, 1)), axis=1)
+
+
+def min_distances(points, centers, block_size=BLOCK_SIZE):
+    # Squared euclidean distance from every point to its closest center, computed block by block
+    distances = np.full(len(points), np.inf)
+    if len(centers) == 0:
+        return distances
+
+    center_norms = np.einsum("ij,ij->i", centers, centers)
+    for start in range(0, len(points), block_size):
+        block = points[start:start + block_size]
+        norms = np.einsum("ij,ij->i", block, block)
+        for c_start in range(0, len(centers), block_size):
+            c_end = c_start + block_size
+            d = norms[:, None] + center_norms[None, c_start:c_end] - 2 * np.dot(block, centers[c_start:c_end].T)
+            distances[start:start + block_size] = np.minimum(distances[start:start + block_size], d.min(axis=1))
+    return np.maximum(distances, 0)
+
+
+class QueryStrategy(object):
+    # Chooses the flights to label among the unlabeled ones. The pool is scored in chunks, reduce keeps the rows of
+    # a chunk that select could pick, and select then chooses among the rows kept from all the chunks.
+    # probabilities and file_names have a row per flight, features and labeled_features are only given to the
+    # strategies that use them. label_counts is the number of unlabeled flights predicted as each label in the
+    # whole pool (the column of the highest probability, trailing labels never predicted are left out).
+    # disagreement, how much the members of a committee disagree on each flight, is only given in committee mode.
+    uses_features = False
+    uses_disagreement = False
+
+    def reduce(self, probabilities, file_names, amount_to_label, disagreement=None):
+        # Keeping every row is always right, only memory is saved by keeping fewer
+        return np.arange(len(probabilities))
+
+    def select(self, probabilities, file_names, amount_to_label, features=None, labeled_features=None,
+               label_counts=None, disagreement=None):
+        raise NotImplementedError
+
+
+class DefaultStrategy(QueryStrategy):
+    # Half the batch with the lowest maximum probability, half almost classified as the rarest label
+    def reduce(self, probabilities, file_names, amount_to_label, disagreement=None):
+        # The most uncertain rows of the chunk and, as the rarest label is not known yet, for every label the rows
+        # closest to it among those predicted otherwise. The uncertain rows can take up to num_uncertain of them.
+        file_names = np.asarray(file_names)
+        max_proba = np.max(probabilities, axis=1)
+        predicted = np.argmax(probabilities, axis=1)
+        num_uncertain = int(np.ceil(amount_to_label / 2.0))
+
+        keep = [smallest([max_proba, predicted, file_names], num_uncertain)]
+        for label in range(probabilities.shape[1]):
+            keep.append(smallest([-probabilities[:, label], max_proba, predicted, file_names], amount_to_label,
+                                 np.flatnonzero(predicted != label)))
+        return np.unique(np.concatenate(keep))
+
+    def select(self, probabilities, file_names, amount_to_label, features=None, labeled_features=None,
+               label_counts=None, disagreement=None):
+        return select_flights(probabilities, file_names, amount_to_label, label_counts)
+
+
+class MarginStrategy(QueryStrategy):
+    def reduce(self, probabilities, file_names, amount_to_label, disagreement=None):
+        return smallest([margin(probabilities), np.asarray(file_names)], amount_to_label)
+
+    def select(self, probabilities, file_names, amount_to_label, features=None, labeled_features=None,
+               label_counts=None, disagreement=None):
+        file_names = np.asarray(file_names)
+        return list(file_names[self.reduce(probabilities, file_names, amount_to_label)])
+
+
+class EntropyStrategy(QueryStrategy):
+    def reduce(self, probabilities, file_names, amount_to_label, disagreement=None):
+        return smallest([-entropy(probabilities), np.asarray(file_names)], amount_to_label)
+
+    def select(self, probabilities, file_names, amount_to_label, features=None, labeled_features=None,
+               label_counts=None, disagreement=None):
+        file_names = np.asarray(file_names)
+        return list(file_names[self.reduce(probabilities, file_names, amount_to_label)])
+
+
+class KCenterStrategy(QueryStrategy):
+    # The candidates_factor * amount_to_label flights with the smallest margin are the candidates. Greedy k-center
+    # then picks, one at a time, the candidate farthest from the labeled flights and from the ones already picked.
+    # With candidates_factor=None every unlabeled flight is a candidate.
+    uses_features = True
+
+    def __init__(self, candidates_factor=10, block_size=BLOCK_SIZE):
+        self.candidates_factor = candidates_factor
+        self.block_size = block_size
+
+    def reduce(self, probabilities, file_names, amount_to_label, disagreement=None):
+        return _candidates(probabilities, np.asarray(file_names), amount_to_label, self.candidates_factor)
+
+    def select(self, probabilities, file_names, amount_to_label, features=None, labeled_features=None,
+               label_counts=None, disagreement=None):
+        file_names = np.asarray(file_names)
+        candidates = _candidates(probabilities, file_names, amount_to_label, self.candidates_factor)
+        points = np.asarray(features[candidates], dtype=np.float64)
+
+        if labeled_features is not None and len(labeled_features):
+            distances = min_distances(points, np.asarray(labeled_features, dtype=np.float64), self.block_size)
+        else:
+            distances = np.full(len(points), np.inf)
+
+        selected = []
+        for _ in range(min(amount_to_label, len(points))):
+            # Ties, like the very first pick without labeled flights, go to the most uncertain candidate
+            best = int(np.argmax(distances))
+            selected.append(best)
+            distances = np.minimum(distances, min_distances(points, points[best:best + 1], self.block_size))
+            distances[selected] = -1
+
+        return list(file_names[candidates[selected]])
+
+
+class ClusterStrategy(QueryStrategy):
+    # The candidates, as in KCenterStrategy, are split into amount_to_label clusters and the most uncertain
+    # candidate of each cluster is picked
+    uses_features = True
+
+    def __init__(self, candidates_factor=10, random_state=26):
+        self.candidates_factor = candidates_factor
+        self.random_state = random_state
+
+    def reduce(self, probabilities, file_names, amount_to_label, disagreement=None):
+        return _candidates(probabilities, np.asarray(file_names), amount_to_label, self.candidates_factor)
+
+    def select(self, probabilities, file_names, amount_to_label, features=None, labeled_features=None,
+               label_counts=None, disagreement=None):
+        file_names = np.asarray(file_names)
+        candidates = _candidates(probabilities, file_names, amount_to_label, self.candidates_factor)
+        if len(candidates) <= amount_to_label:
+            return list(file_names[candidates])
+
+        clusters = KMeans(n_clusters=amount_to_label, n_init=1, random_state=self.random_state)\
+            .fit_predict(np.asarray(features[candidates], dtype=np.float64))
+
+        # Candidates are sorted by margin, the first of each cluster is its most uncertain one
+        _, first = np.unique(clusters, return_index=True)
+        return list(file_names[candidates[np.sort(first)]])
+
+
+class DisagreementStrategy(QueryStrategy):
+    # The flights the members of the committee disagree the most on
+    uses_disagreement = True
+
+    def reduce(self, probabilities, file_names, amount_to_label, disagreement=None):
+        if disagreement is None:
+            raise ValueError("The committee strategy needs the disagreement of a committee")
+        return smallest([-disagreement, np.asarray(file_names)], amount_to_label)
+
+    def select(self, probabilities, file_names, amount_to_label, features=None, labeled_features=None,
+               label_counts=None, disagreement=None):
+        file_names = np.asarray(file_names)
+        return list(file_names[self.reduce(probabilities, file_names, amount_to_label, disagreement)])
+
+
+def _candidates(probabilities, file_names, amount_to_label, factor):
+    # Rows of the most uncertain flights, sorted by margin
+    keys = [margin(probabilities), file_names]
+    if factor is None:
+        return np.lexsort(keys[::-1])
+    return smallest(keys, factor * amount_to_label)
+
+
+STRATEGIES = {
+    "default": DefaultStrategy,
+    "margin": MarginStrategy,
+    "entropy": EntropyStrategy,
+    "kcenter": KCenterStrategy,
+    "cluster": ClusterStrategy,
+    "committee": DisagreementStrategy,
+}
+
+
+def get_strategy(strategy):
+    # A strategy, given by its name in STRATEGIES or as a QueryStrategy
+    if isinstance(strategy, QueryStrategy):
+        return strategy
+    try:
+        return STRATEGIES[strategy]()
+    except KeyError:
+        raise ValueError("Unknown query strategy '{}', expected one of {}".format(strategy, sorted(STRATEGIES)))
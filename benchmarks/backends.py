@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Every classifier backend on a synthetic feature file: fit time on a sample of the flights, time to score the whole
+# pool and macro F1 on the validation flights, then the one choose_backend picks within TOLERANCE with every flight
+# labeled. A simulated labeling session per backend, and one with "auto" choosing once MIN_LABELED flights are
+# labeled, gives the mean fit and query time of a round and the macro F1 after the last round.
+#
+#   python -m benchmarks.backends
+
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from active_learning.active_learning import ActiveLearning
+from active_learning.backends import BACKENDS, choose_backend
+from active_learning.simulation import load_oracle, simulate, synthetic_features
+
+# ==========================
+
+NUM_FLIGHTS = 100000
+ROUNDS = 20
+AMOUNT_TO_LABEL = 10
+LABELS = ["A", "B", "C"]
+TOLERANCE = .02
+
+# ==========================
+
+
+def session(features, oracle, validation, backend):
+    model = ActiveLearning(LABELS, features, "", amount_to_label=AMOUNT_TO_LABEL, backend=backend,
+                           backend_tolerance=TOLERANCE)
+    model.load_validation(validation)
+    rounds = simulate(model, oracle, ROUNDS)
+    rounds = rounds[rounds["round"] > 0]
+    return model.backend, rounds["fit"].mean(), rounds["query"].mean(), rounds["f1"].iloc[-1]
+
+
+if __name__ == '__main__':
+    directory = tempfile.mkdtemp()
+    try:
+        features, truth, validation = synthetic_features(directory, NUM_FLIGHTS, labels=LABELS)
+        oracle = load_oracle(truth, LABELS)
+
+        model = ActiveLearning(LABELS, features, "")
+        model.load_validation(validation)
+        labels = np.array([oracle[os.path.basename(f)] for f in model.filenames])
+        backend, results = choose_backend(model.features, labels, model.validation_features,
+                                          model.validation_labels, tolerance=TOLERANCE)
+        print(results.to_string(index=False, float_format="{:.4f}".format))
+        print("auto: {}\n".format(backend))
+
+        print("{:>24} {:>10} {:>10} {:>8}".format("backend", "fit (s)", "query (s)", "f1"))
+        for name in sorted(BACKENDS) + ["auto"]:
+            chosen, fit, query, f1 = session(features, oracle, validation, name)
+            if chosen != name:
+                name = "{} ({})".format(name, chosen)
+            print("{:>24} {:>10.4f} {:>10.4f} {:>8.3f}".format(name, fit, query, f1))
+    finally:
+        shutil.rmtree(directory)
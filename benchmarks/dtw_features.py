@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Throughput of the DTW feature builder on synthetic flights, with one process and with all cores, and with and
+# without lower bound pruning.
+#
+#   python -m benchmarks.dtw_features
+
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from active_learning.features import compute_features, list_flights
+
+# ==========================
+
+NUM_FLIGHTS = 400
+NUM_REFERENCES = 50
+LENGTH = 256
+
+# ==========================
+
+
+def write_flights(data_dir, num_flights, rng):
+    # Climb, cruise and descent at random altitudes and durations, with the two header layouts of the real data
+    for i in range(num_flights):
+        samples = rng.randint(1000, 5000)
+        cruise = rng.uniform(500, 4000)
+        profile = np.minimum(1, np.minimum(np.arange(samples), samples - np.arange(samples)) / rng.uniform(100, 800))
+        flight = pd.DataFrame({
+            "AltGPS": cruise * profile + rng.randn(samples) * 10,
+            "Roll": rng.randn(samples),
+            "Pitch": rng.randn(samples),
+            "HDG": np.cumsum(rng.randn(samples)) % 360,
+            "Latitude": 40 + np.cumsum(rng.randn(samples)) * 1e-4,
+            "Longitude": -86 + np.cumsum(rng.randn(samples)) * 1e-4,
+        })
+        with open(os.path.join(data_dir, "flight_{:05d}.csv".format(i)), "w", encoding="latin1") as fh:
+            fh.write("#airframe_info\n" * (1 + i % 2))
+            flight.to_csv(fh, index=False)
+
+
+if __name__ == '__main__':
+    data_dir = tempfile.mkdtemp()
+    try:
+        write_flights(data_dir, NUM_FLIGHTS, np.random.RandomState(26))
+        file_names = list_flights(data_dir)
+        references = file_names[:NUM_REFERENCES]
+
+        # Cut-off at the median distance, so about half of the pairs can be pruned
+        _, sample = compute_features(file_names[:20], references, length=LENGTH, workers=1)
+        cutoff = float(np.median(sample))
+
+        print("{} flights, {} references, {} cores".format(NUM_FLIGHTS, NUM_REFERENCES, os.cpu_count()))
+        print("{:>8} {:>14} {:>12}".format("workers", "max_distance", "flights/s"))
+        for workers in (1, None):
+            for max_distance in (None, cutoff):
+                start = time.perf_counter()
+                compute_features(file_names, references, length=LENGTH, max_distance=max_distance, workers=workers)
+                elapsed = time.perf_counter() - start
+                print("{:>8} {:>14} {:>12.1f}".format(workers or os.cpu_count(),
+                                                      "-" if max_distance is None else "{:.0f}".format(max_distance),
+                                                      NUM_FLIGHTS / elapsed))
+    finally:
+        shutil.rmtree(data_dir)
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Times every query strategy on a synthetic pool of 100k flights and measures how spread out the batches they
+# pick are (mean distance between the flights of the batch).
+#
+#   python -m benchmarks.query_strategies
+
+import time
+
+import numpy as np
+
+from active_learning.strategies import STRATEGIES, get_strategy
+from benchmarks.select_flights import random_pool
+
+# ==========================
+
+SIZE = 100000
+NUM_FEATURES = 100
+NUM_LABELED = 1000
+AMOUNTS = [10, 50]
+
+# ==========================
+
+
+def mean_distance(points):
+    diff = points[:, None, :] - points[None, :, :]
+    distances = np.sqrt((diff ** 2).sum(axis=2))
+    return distances.sum() / max(1, len(points) * (len(points) - 1))
+
+
+if __name__ == '__main__':
+    rng = np.random.RandomState(26)
+    probabilities, file_names = random_pool(SIZE, rng)
+    features = rng.rand(SIZE, NUM_FEATURES).astype(np.float32)
+    labeled_features = rng.rand(NUM_LABELED, NUM_FEATURES).astype(np.float32)
+    # Disagreement of a committee, only used by the committee strategy
+    disagreement = rng.rand(SIZE)
+    rows = {name: i for i, name in enumerate(file_names)}
+
+    print("{:>10} {:>8} {:>10} {:>14}".format("strategy", "amount", "time (s)", "mean distance"))
+    for amount in AMOUNTS:
+        for name in sorted(STRATEGIES):
+            strategy = get_strategy(name)
+            start = time.perf_counter()
+            selected = strategy.select(probabilities, file_names, amount, features, labeled_features,
+                                       disagreement=disagreement)
+            elapsed = time.perf_counter() - start
+
+            spread = mean_distance(features[[rows[fn] for fn in selected]].astype(np.float64))
+            print("{:>10} {:>8} {:>10.4f} {:>14.3f}".format(name, amount, elapsed, spread))
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Simulated labeling sessions on a wide synthetic feature file with every reduction and several widths: time to
+# reduce the features (first load), mean fit and query time of a round and macro F1 after the last round.
+#
+#   python -m benchmarks.reduction
+
+import shutil
+import tempfile
+import time
+
+from active_learning.active_learning import ActiveLearning
+from active_learning.reduction import REDUCTIONS
+from active_learning.simulation import load_oracle, simulate, synthetic_features
+
+# ==========================
+
+NUM_FLIGHTS = 20000
+NUM_FEATURES = 1000
+WIDTHS = [16, 64, 256]
+ROUNDS = 10
+AMOUNT_TO_LABEL = 10
+LABELS = ["A", "B", "C"]
+
+# ==========================
+
+
+def session(features, truth, validation, **kwargs):
+    start = time.perf_counter()
+    model = ActiveLearning(LABELS, features, "", amount_to_label=AMOUNT_TO_LABEL, **kwargs)
+    model.load_validation(validation)
+    loaded = time.perf_counter() - start
+
+    rounds = simulate(model, load_oracle(truth, LABELS), ROUNDS)
+    rounds = rounds[rounds["round"] > 0]
+    return loaded, rounds["fit"].mean(), rounds["query"].mean(), rounds["f1"].iloc[-1]
+
+
+if __name__ == '__main__':
+    directory = tempfile.mkdtemp()
+    try:
+        features, truth, validation = synthetic_features(directory, NUM_FLIGHTS, n_features=NUM_FEATURES,
+                                                         labels=LABELS)
+        # The transformed features are cached once, the load times below only count the reductions
+        ActiveLearning(LABELS, features, "")
+
+        print("{:>10} {:>6} {:>10} {:>10} {:>10} {:>8}".format("reduction", "width", "load (s)", "fit (s)",
+                                                                  "query (s)", "f1"))
+        print("{:>10} {:>6} {:>10.3f} {:>10.4f} {:>10.4f} {:>8.3f}".format(
+            "none", NUM_FEATURES, *session(features, truth, validation)))
+        for reduction in REDUCTIONS:
+            for width in WIDTHS:
+                print("{:>10} {:>6} {:>10.3f} {:>10.4f} {:>10.4f} {:>8.3f}".format(
+                    reduction, width, *session(features, truth, validation, reduction=reduction,
+                                               n_components=width)))
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Times the query selection of ActiveLearning on synthetic pools and checks it against the original
+# implementation based on sorted Python lists.
+#
+#   python -m benchmarks.select_flights
+
+import time
+
+import numpy as np
+
+from active_learning.strategies import select_flights
+
+# ==========================
+
+SIZES = [10000, 100000, 1000000]
+NUM_LABELS = 3
+AMOUNT_TO_LABEL = 10
+REFERENCE_LIMIT = 100000
+
+# ==========================
+
+
+def reference_select_flights(probabilities, file_names, amount_to_label):
+    sorted_probs = [[np.max(p), np.argmax(p), file_names[i]] + list(p) for i, p in enumerate(probabilities)]
+    sorted_probs = sorted(sorted_probs)
+
+    num_uncertain = int(np.ceil(amount_to_label / 2.0))
+    num_almost_labeled = amount_to_label - num_uncertain
+
+    selected = [x[2] for x in sorted_probs[:num_uncertain]]
+
+    labels = [x[1] for x in sorted_probs]
+    label_fewest = np.argsort(np.bincount(labels))[0]
+
+    reduced = sorted_probs[len(selected):]
+    reduced = [x for x in reduced if x[1] != label_fewest]
+    reduced = sorted(reduced, key=lambda x: x[3 + label_fewest], reverse=True)
+    return selected + [x[2] for x in reduced[:num_almost_labeled]]
+
+
+def random_pool(size, rng, decimals=None):
+    probabilities = rng.dirichlet(np.ones(NUM_LABELS), size=size)
+    if decimals is not None:
+        # Coarse probabilities produce plenty of ties
+        probabilities = np.round(probabilities, decimals)
+    file_names = np.array(["flight_{:07d}.csv".format(i) for i in rng.permutation(size)], dtype=object)
+    return probabilities, file_names
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    rng = np.random.RandomState(26)
+
+    print("{:>10} {:>14} {:>14} {:>10}".format("flights", "vectorized (s)", "reference (s)", "identical"))
+    for size in SIZES:
+        for decimals in (None, 2):
+            probabilities, file_names = random_pool(size, rng, decimals)
+            selected, elapsed = timed(select_flights, probabilities, file_names, AMOUNT_TO_LABEL)
+
+            if size <= REFERENCE_LIMIT:
+                expected, elapsed_ref = timed(reference_select_flights, probabilities, file_names, AMOUNT_TO_LABEL)
+                identical = str(selected == expected)
+                elapsed_ref = "{:.4f}".format(elapsed_ref)
+            else:
+                identical = elapsed_ref = "-"
+
+            print("{:>10} {:>14.4f} {:>14} {:>10}".format(size, elapsed, elapsed_ref, identical))
@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Simulated labeling sessions on synthetic pools: time to load the model, mean time of every phase of a round and
+# macro F1 after the last round.
+#
+#   python -m benchmarks.simulation
+
+import os
+import shutil
+import tempfile
+import time
+
+from active_learning.active_learning import ActiveLearning
+from active_learning.simulation import PHASES, load_oracle, simulate, synthetic_features
+
+# ==========================
+
+SIZES = [10000, 100000, 1000000]
+ROUNDS = 10
+AMOUNT_TO_LABEL = 10
+LABELS = ["A", "B", "C"]
+
+# ==========================
+
+
+if __name__ == '__main__':
+    directory = tempfile.mkdtemp()
+    try:
+        print("{:>10} {:>10} {:>10}".format("flights", "load (s)", "centroids") +
+              "".join("{:>10}".format(phase) for phase in PHASES) + "{:>8}".format("f1"))
+        for size in SIZES:
+            features, truth, validation = synthetic_features(os.path.join(directory, str(size)), size, labels=LABELS)
+
+            start = time.perf_counter()
+            model = ActiveLearning(LABELS, features, "", amount_to_label=AMOUNT_TO_LABEL)
+            model.load_validation(validation)
+            loaded = time.perf_counter() - start
+
+            result = simulate(model, load_oracle(truth, LABELS), ROUNDS)
+            rounds = result[result["round"] > 0]
+            print("{:>10} {:>10.3f} {:>10.3f}".format(size, loaded, result["centroids"].iloc[0]) +
+                  "".join("{:>10.4f}".format(rounds[phase].mean()) for phase in PHASES) +
+                  "{:>8.3f}".format(rounds["f1"].iloc[-1]))
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,37 @@
+from concurrent.futures import ThreadPoolExecutor
+
+
+class FlightPrefetcher(object):
+    # Runs load(filename) in background threads for the flights around the current one, so that moving to the
+    # next or previous flight only has to pick up a finished result. Results outside of the window are dropped.
+    def __init__(self, load, radius=2, max_workers=2):
+        self.load = load
+        self.radius = radius
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._futures = {}
+
+    def get(self, filenames, current):
+        # Current flight first, then its neighbours from the closest to the farthest
+        order = [current]
+        for offset in range(1, self.radius + 1):
+            order += [current + offset, current - offset]
+        window = [filenames[i] for i in order if 0 <= i < len(filenames)]
+
+        for filename in list(self._futures):
+            if filename not in window:
+                self._futures.pop(filename).cancel()
+        for filename in window:
+            if filename not in self._futures:
+                self._futures[filename] = self._executor.submit(self.load, filename)
+
+        return self._futures[filenames[current]].result()
+
+    def clear(self):
+        # Drops every result, they are loaded again when asked for
+        for future in self._futures.values():
+            future.cancel()
+        self._futures = {}
+
+    def shutdown(self):
+        self.clear()
+        self._executor.shutdown(wait=False)
@@ -1,15 +1,38 @@
+import threading
+
 import matplotlib as mpl
 mpl.use('Qt5Agg')
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-from PyQt5.QtWidgets import QDialog, QButtonGroup, QVBoxLayout, QRadioButton, QMessageBox
+from PyQt5.QtWidgets import QDialog, QButtonGroup, QVBoxLayout, QRadioButton, QMessageBox, QLabel, QSizePolicy
+from PyQt5.QtGui import QImage, QPixmap
 from PyQt5.QtCore import Qt
 import numpy as np
 
 from demo.ui.label_flights_dialog import Ui_LabelFlightsDialog
-from util.util import plot_flight_to_label
+from demo.flight_prefetcher import FlightPrefetcher
+from util.util import FlightPlot, load_flight_lod
+
+class FigureImage(QLabel):
+    # Shows a figure rendered to RGBA pixels, resized calls on_resize with the new size
+    def __init__(self, on_resize, parent=None):
+        super(FigureImage, self).__init__(parent)
+        self.on_resize = on_resize
+        self.image = None
+        self.setAlignment(Qt.AlignCenter)
+        self.setSizePolicy(QSizePolicy.Ignored, QSizePolicy.Ignored)
+
+    def show_image(self, image):
+        # The QImage uses the pixels of the array, which is kept as long as it is shown
+        self.image = image
+        height, width = image.shape[:2]
+        self.setPixmap(QPixmap.fromImage(QImage(image.data, width, height, 4 * width, QImage.Format_RGBA8888)))
+
+    def resizeEvent(self, event):
+        super(FigureImage, self).resizeEvent(event)
+        self.on_resize()
+
 
 class LabelFlightsDialog(QDialog):
-    def __init__(self, filenames, labels, parent=None, ensure_two=False):
+    def __init__(self, filenames, labels, parent=None, ensure_two=False, prefetch=2):
         super(LabelFlightsDialog, self).__init__(parent)
         self.ui = Ui_LabelFlightsDialog()
         self.filenames = filenames
@@ -39,6 +62,18 @@ class LabelFlightsDialog(QDialog):
         self.ui.btnNext.clicked.connect(self.on_next_clicked)
         self.ui.btnPrev.clicked.connect(self.on_prev_clicked)
 
+        # The flights are rendered to images in the background, the current one and its neighbours, so moving to
+        # another flight only has to show its images. The render thread keeps its FlightPlot, a new one is only made
+        # when the images are resized.
+        self.prefetcher = None
+        self.image_ts = FigureImage(self.on_image_resized, parent=self)
+        self.image_lat_lon = FigureImage(self.on_image_resized, parent=self)
+        self.ui.widgetLarge.layout().addWidget(self.image_ts)
+        self.ui.widgetSmall.layout().addWidget(self.image_lat_lon)
+        self.sizes = self.image_sizes()
+        self.render_state = threading.local()
+        self.prefetcher = FlightPrefetcher(self.render_flight, radius=prefetch, max_workers=1)
+
         # Update the interface with the current flight
         self.update_current_flight()
 
@@ -75,6 +110,33 @@ class LabelFlightsDialog(QDialog):
         self.current_flight -= 1
         self.update_current_flight()
 
+    def image_sizes(self):
+        return ((max(1, self.image_ts.width()), max(1, self.image_ts.height())),
+                (max(1, self.image_lat_lon.width()), max(1, self.image_lat_lon.height())))
+
+    def render_flight(self, filename):
+        # Runs in the prefetch thread
+        sizes = self.sizes
+        state = self.render_state
+        if getattr(state, "sizes", None) != sizes:
+            state.plot = FlightPlot(*sizes)
+            state.sizes = sizes
+        state.plot.update(load_flight_lod(filename, sizes[0][0]))
+        return state.plot.render()
+
+    def on_image_resized(self):
+        # The rendered flights have the old size, they are rendered again
+        sizes = self.image_sizes()
+        if self.prefetcher is not None and sizes != self.sizes:
+            self.sizes = sizes
+            self.prefetcher.clear()
+            self.show_flight()
+
+    def done(self, result):
+        # Closing the dialog in any way drops the pending prefetches
+        self.prefetcher.shutdown()
+        super(LabelFlightsDialog, self).done(result)
+
     def accept(self):
         if self.ensure_two and len(set(self.labels)) < 2:
             self.releaseKeyboard()
@@ -115,27 +177,10 @@ class LabelFlightsDialog(QDialog):
         self.ui.btnPrev.setEnabled(self.current_flight > 0)
         self.ui.btnNext.setEnabled(self.current_flight < len(self.filenames) - 1)
 
-        # Plot the flight
-        size_large = (self.ui.widgetLarge.size().width(), self.ui.widgetLarge.size().height())
-        size_small = (self.ui.widgetSmall.size().width(), self.ui.widgetSmall.size().height())
-        fig_ts, fig_lat_lon = plot_flight_to_label(
-            self.filenames[self.current_flight],
-            size_large,
-            size_small
-        )
-
-        # Display Time Series
-        canvas = FigureCanvas(fig_ts)
-        layout = self.ui.widgetLarge.layout()
-        for i in range(layout.count()):
-            layout.itemAt(i).widget().deleteLater()
-        layout.addWidget(canvas)
-
-        # Display Lat/Lon
-        canvas = FigureCanvas(fig_lat_lon)
-        layout = self.ui.widgetSmall.layout()
-        for i in range(layout.count()):
-            layout.itemAt(i).widget().deleteLater()
-        layout.addWidget(canvas)
-
+        self.show_flight()
         self.seen[self.current_flight] = True
+
+    def show_flight(self):
+        image_ts, image_lat_lon = self.prefetcher.get(self.filenames, self.current_flight)
+        self.image_ts.show_image(image_ts)
+        self.image_lat_lon.show_image(image_lat_lon)
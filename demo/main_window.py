@@ -1,10 +1,25 @@
+import functools
+
+import numpy as np
 import pandas as pd
-from PyQt5.QtWidgets import QMainWindow, QLabel, QMessageBox, QFileDialog
-from PyQt5.QtCore import Qt
+from PyQt5.QtWidgets import QMainWindow, QLabel, QMessageBox, QFileDialog, QProgressDialog
+from PyQt5.QtCore import Qt, QTimer
 from demo.ui.main_window import Ui_MainWindow
 from demo.change_label_dialog import ChangeLabelDialog
 from demo.label_flights_dialog import LabelFlightsDialog
+from demo.model_worker import ModelJob, ProgressReporter
 from demo.show_clusters_dialog import ShowClustersDialog
+from util import timing
+
+# Milliseconds between updates of the timings in the status bar
+TIMING_INTERVAL = 1000
+
+SESSION_EXTENSION = ".session"
+SESSION_FILTER = "Sessions (*{})".format(SESSION_EXTENSION)
+CSV_FILTER = "CSV Files (*.csv)"
+SAVE_FILTERS = ";;".join([SESSION_FILTER, CSV_FILTER])
+LOAD_FILTERS = ";;".join(["Training data (*{} *.csv)".format(SESSION_EXTENSION), SESSION_FILTER, CSV_FILTER])
+
 
 class MainWindow(QMainWindow):
     def __init__(self, model, parent=None):
@@ -14,6 +29,27 @@ class MainWindow(QMainWindow):
 
         self.ui.setupUi(self)
 
+        # Model calls run in worker threads, see run_job
+        self.jobs = []
+        self.cancelled_jobs = []
+        self.idle_state = None
+        self.progress = None
+        self.reporter = ProgressReporter()
+        self.reporter.progress.connect(self.on_job_progress)
+        self.model.on_progress = self.reporter.report
+
+        # Flights and labels of the last classification, what Show clusters shows while the model is busy
+        self.clusters = None
+
+        # Recent timings of the model and of the plots, when timing is enabled
+        self.timing_label = None
+        if timing.enabled:
+            self.timing_label = QLabel(parent=self)
+            self.statusBar().addPermanentWidget(self.timing_label)
+            self.timing_timer = QTimer(self)
+            self.timing_timer.timeout.connect(self.update_timings)
+            self.timing_timer.start(TIMING_INTERVAL)
+
         # Create QLabels for the flight labels
         self.setup_labels()
 
@@ -31,37 +67,57 @@ class MainWindow(QMainWindow):
         self.ui.btnSave.clicked.connect(self.on_save_clicked)
         self.ui.btnLoad.clicked.connect(self.on_load_clicked)
 
+        # Labels read back from the journal of an interrupted session
+        if self.model.get_labeled_training():
+            self.resume_labeling()
+
     def on_save_clicked(self):
-        filename, _ = QFileDialog.getSaveFileName(self, "Save training data", filter="CSV Files (*.csv)")
+        filename, selected = QFileDialog.getSaveFileName(self, "Save training data", filter=SAVE_FILTERS)
 
         # No input, nothing to do
         if not filename:
             return
 
-        # Make sure we have a .csv extension
-        if not filename.endswith(".csv"):
-            filename += ".csv"
-
-        self.model.save_to_csv(filename)
-
+        # CSV files only have the labels, sessions also keep the trained model
+        if selected == CSV_FILTER or filename.endswith(".csv"):
+            if not filename.endswith(".csv"):
+                filename += ".csv"
+            self.model.save_to_csv(filename)
+        else:
+            if not filename.endswith(SESSION_EXTENSION):
+                filename += SESSION_EXTENSION
+            self.model.save_session(filename)
 
     def on_load_clicked(self):
 
         # TODO: Warning of reset
 
-        filename, _ = QFileDialog.getOpenFileName(self, "Load training data", filter="CSV Files (*.csv)")
+        filename, _ = QFileDialog.getOpenFileName(self, "Load training data", filter=LOAD_FILTERS)
 
         # No input, notothing to do
         if not filename:
             return
 
-        if self.model.load_from_csv(filename):
-            self.setup_labels()
-            self.ui.btnStart.setText("Stop")
-            self.ui.btnLabelMore.setEnabled(True)
-            self.ui.btnShowClusters.setEnabled(True)
-            self.ui.btnChangeLabels.setEnabled(False)
-            self.ui.btnSave.setEnabled(True)
+        if filename.endswith(".csv"):
+            loaded = self.model.load_from_csv(filename)
+        else:
+            loaded = self.model.load_session(filename)
+
+        if loaded:
+            self.resume_labeling()
+
+    def resume_labeling(self):
+        # Goes on labeling with the labels the model already has
+        self.clusters = None
+        self.setup_labels()
+        self.ui.btnStart.setText("Stop")
+        self.ui.btnLabelMore.setEnabled(True)
+        self.ui.btnShowClusters.setEnabled(True)
+        self.ui.btnChangeLabels.setEnabled(False)
+        self.ui.btnSave.setEnabled(True)
+
+        # Immediate for a session that has its trained model
+        self.update_labels()
 
     def keyPressEvent(self, QKeyEvent):
         if QKeyEvent.key() == Qt.Key_Enter or QKeyEvent.key() == Qt.Key_Return:
@@ -108,29 +164,92 @@ class MainWindow(QMainWindow):
 
         if change_dialog.exec_():
             self.model.set_label_names(change_dialog.get_labels())
+            self.clusters = None
             self.setup_labels()
             self.ui.btnShowClusters.setEnabled(False)
 
+    def run_job(self, message, func, on_done, *args):
+        # Runs func(*args) in a worker thread and calls on_done with its result. While there are jobs running, also
+        # cancelled ones that did not finish yet, the buttons are disabled: the model is locked by the job. Show
+        # clusters is left enabled when it has clusters to show, it does not need the model.
+        job = ModelJob(func, *args, parent=self)
+        job.done.connect(functools.partial(self.on_job_done, job, on_done))
+        job.failed.connect(functools.partial(self.on_job_done, job, self.on_job_failed))
+        job.finished.connect(functools.partial(self.on_job_thread_finished, job))
+        job.finished.connect(job.deleteLater)
+
+        if not self.jobs and not self.cancelled_jobs:
+            self.idle_state = {button: button.isEnabled() for button in self.job_buttons()}
+            for button in self.job_buttons():
+                if button is not self.ui.btnShowClusters or self.clusters is None:
+                    button.setEnabled(False)
+
+        if self.progress is None:
+            self.progress = QProgressDialog(message, "Cancel", 0, 100, self)
+            self.progress.setWindowModality(Qt.NonModal)
+            self.progress.setMinimumDuration(500)
+            self.progress.canceled.connect(self.on_jobs_cancelled)
+            self.progress.setValue(0)
+        else:
+            self.progress.setLabelText(message)
+
+        self.jobs.append(job)
+        job.start()
+
+    def job_buttons(self):
+        return [self.ui.btnStart, self.ui.btnChangeLabels, self.ui.btnLabelMore, self.ui.btnShowClusters,
+                self.ui.btnSave, self.ui.btnLoad]
+
+    def on_job_done(self, job, callback, result):
+        # A cancelled job may still deliver a result that was already queued
+        if job.cancelled:
+            return
+        self.on_job_finished(job)
+        callback(result)
+
+    def on_job_finished(self, job):
+        self.jobs.remove(job)
+        if not self.jobs:
+            self.progress.reset()
+            self.progress = None
+            self.restore_buttons()
+
+    def on_job_thread_finished(self, job):
+        # The thread of a cancelled job is done, the model is free once they all are
+        if job in self.cancelled_jobs:
+            self.cancelled_jobs.remove(job)
+            self.restore_buttons()
+
+    def restore_buttons(self):
+        if not self.jobs and not self.cancelled_jobs:
+            for button, enabled in self.idle_state.items():
+                button.setEnabled(enabled)
+
+    def on_job_progress(self, value):
+        if self.progress is not None:
+            self.progress.setValue(min(value, 99))
+
+    def on_jobs_cancelled(self):
+        # The running jobs are left to finish in the background, their results are dropped. The buttons stay disabled
+        # until their threads are done, see on_job_thread_finished.
+        for job in self.jobs[:]:
+            job.cancel()
+            if job.isRunning():
+                self.cancelled_jobs.append(job)
+            self.on_job_finished(job)
+
+    def on_job_failed(self, error):
+        msg = QMessageBox()
+        msg.setIcon(QMessageBox.Critical)
+        msg.setText("Something went wrong")
+        msg.setInformativeText(error)
+        msg.setWindowTitle("Error")
+        msg.setStandardButtons(QMessageBox.Ok)
+        msg.exec_()
+
     def on_start_clicked(self):
         if self.ui.btnStart.text() == "Start":
-            centroids = self.model.get_centroids()
-            dialog = LabelFlightsDialog(centroids, self.model.get_label_names(), ensure_two=True)
-            if dialog.exec_():
-                self.model.restart()
-                centroid_labels = dialog.get_labels()
-                self.model.label_flights([(c, l) for c, l in  zip(centroids, centroid_labels)])
-
-                self.ui.btnStart.setText("Stop")
-                self.ui.btnLabelMore.setEnabled(True)
-                self.ui.btnShowClusters.setEnabled(True)
-                self.ui.btnChangeLabels.setEnabled(False)
-                self.ui.btnSave.setEnabled(True)
-
-                self.ui.btnStart.setDefault(False)
-                self.ui.btnShowClusters.setDefault(False)
-                self.ui.btnLabelMore.setDefault(True)
-
-                self.update_labels()
+            self.run_job("Looking for the cluster centroids...", self.model.get_centroids, self.on_centroids_ready)
         else:
             self.ui.btnStart.setText("Start")
             self.ui.btnLabelMore.setEnabled(False)
@@ -140,8 +259,31 @@ class MainWindow(QMainWindow):
             self.ui.btnLabelMore.setDefault(False)
             self.ui.btnShowClusters.setDefault(True)
 
+    def on_centroids_ready(self, centroids):
+        dialog = LabelFlightsDialog(centroids, self.model.get_label_names(), ensure_two=True)
+        if dialog.exec_():
+            self.model.restart()
+            self.clusters = None
+            centroid_labels = dialog.get_labels()
+            self.model.label_flights([(c, l) for c, l in  zip(centroids, centroid_labels)])
+
+            self.ui.btnStart.setText("Stop")
+            self.ui.btnLabelMore.setEnabled(True)
+            self.ui.btnShowClusters.setEnabled(True)
+            self.ui.btnChangeLabels.setEnabled(False)
+            self.ui.btnSave.setEnabled(True)
+
+            self.ui.btnStart.setDefault(False)
+            self.ui.btnShowClusters.setDefault(False)
+            self.ui.btnLabelMore.setDefault(True)
+
+            self.update_labels()
+
     def on_label_more_clicked(self):
-        flights_to_label = self.model.get_flights_to_label()
+        self.run_job("Training the model and choosing flights...", self.model.get_flights_to_label,
+                     self.on_flights_to_label_ready)
+
+    def on_flights_to_label_ready(self, flights_to_label):
         dialog = LabelFlightsDialog(flights_to_label, self.model.get_label_names())
         if dialog.exec_():
             labels = dialog.get_labels()
@@ -149,17 +291,39 @@ class MainWindow(QMainWindow):
             self.update_labels()
 
     def on_show_clusters_clicked(self):
-        training_filename, training_label = self.model.get_labeled_training()
-        test_filename, test_label = self.model.get_labeled_test()
-
-        file_names = list(test_filename) + list(training_filename)
-        labels = list(test_label) + list(training_label)
+        # The clusters of the last training, the model may be busy with the next one
+        if self.clusters is not None:
+            self.show_clusters()
+        else:
+            self.run_job("Classifying the flights...", self.classify_flights, self.on_clusters_ready)
 
-        dialog = ShowClustersDialog(file_names, labels, self.model.get_label_names())
+    def show_clusters(self):
+        file_names, labels, label_names = self.clusters
+        dialog = ShowClustersDialog(file_names, labels, label_names)
         dialog.exec_()
 
-    def update_labels(self):
-        distrib = self.model.get_label_distribution()
+    def classify_flights(self):
+        # Runs in a worker thread, trains the model when needed and classifies the unlabeled flights
+        test_filename, test_label = self.model.get_labeled_test()
+        training_filename, training_label = self.model.get_labeled_training()
+        return (list(test_filename) + list(training_filename), list(test_label) + list(training_label),
+                self.model.get_label_names())
 
-        for i, (name, amount) in enumerate(zip(self.model.get_label_names(), distrib)):
+    def on_clusters_ready(self, clusters):
+        self.clusters = clusters
+        self.show_clusters()
+
+    def update_labels(self):
+        # Also trains the model, so the next Label more only has to pick the flights, and keeps the clusters for
+        # Show clusters
+        self.run_job("Training the model...", self.classify_flights, self.on_label_distribution_ready)
+
+    def update_timings(self):
+        self.timing_label.setText(timing.format_summary())
+
+    def on_label_distribution_ready(self, clusters):
+        self.clusters = clusters
+        _, labels, label_names = clusters
+        distrib = np.bincount(labels, minlength=len(label_names))
+        for i, (name, amount) in enumerate(zip(label_names, distrib)):
             self.ui.layoutLabels.itemAt(i).widget().setText("{} ({})".format(name, amount))
@@ -0,0 +1,37 @@
+from PyQt5.QtCore import QObject, QThread, pyqtSignal
+
+
+class ModelJob(QThread):
+    # Runs func(*args) away from the GUI thread, the result comes back through the `done` signal. Cancelling can not
+    # interrupt scikit-learn, the job still runs to the end but none of its signals are emitted.
+    done = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    def __init__(self, func, *args, parent=None):
+        super(ModelJob, self).__init__(parent)
+        self.func = func
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def run(self):
+        try:
+            result = self.func(*self.args)
+        except Exception as e:
+            if not self.cancelled:
+                self.failed.emit(str(e))
+            return
+
+        if not self.cancelled:
+            self.done.emit(result)
+
+
+class ProgressReporter(QObject):
+    # Thread-safe progress callback, `report` can be called from any thread and `progress` is delivered in the
+    # thread of the receiver
+    progress = pyqtSignal(int)
+
+    def report(self, fraction):
+        self.progress.emit(int(100 * fraction))
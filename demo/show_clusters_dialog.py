@@ -4,7 +4,7 @@ from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from PyQt5.QtWidgets import QDialog, QButtonGroup, QVBoxLayout, QRadioButton, QMessageBox
 
 from demo.ui.show_clusters_dialog import Ui_ShowClustersDialog
-from util.util import plot_flights
+from util.util import FlightGridPlot, load_flights_lod
 
 class ShowClustersDialog(QDialog):
     def __init__(self, filenames, labels, label_names, parent=None):
@@ -22,8 +22,12 @@ class ShowClustersDialog(QDialog):
 
         self.ui.setupUi(self)
 
-        # Create layout for canvas
+        # Create layout and the canvas, which is reused for every page
         self.ui.widget.setLayout(QVBoxLayout())
+        figsize = (self.ui.widget.size().width(), self.ui.widget.size().height())
+        self.plot = FlightGridPlot(self.grid, figsize)
+        self.canvas = FigureCanvas(self.plot.fig)
+        self.ui.widget.layout().addWidget(self.canvas)
 
         # Separate flights per cluster
         self.clusters = [[] for _ in label_names]
@@ -91,12 +95,6 @@ class ShowClustersDialog(QDialog):
         idx_start = self.current_flight
         idx_end = self.current_flight + self.num_flights
         flights_to_plot = self.clusters[self.current_cluster][idx_start:idx_end]
-        figsize = (self.ui.widget.size().width(), self.ui.widget.size().height())
-        fig = plot_flights(flights_to_plot, self.grid, figsize)
-
-        # Display the flights
-        canvas = FigureCanvas(fig)
-        layout = self.ui.widget.layout()
-        for i in range(layout.count()):
-            layout.itemAt(i).widget().deleteLater()
-        layout.addWidget(canvas)
+        plot_width = self.canvas.width() // self.grid[1]
+        self.plot.update(flights_to_plot, load_flights_lod(flights_to_plot, plot_width))
+        self.plot.draw()
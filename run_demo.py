@@ -9,6 +9,7 @@ import sys
 from PyQt5.QtWidgets import QApplication
 from demo.main_window import MainWindow
 from active_learning import ActiveLearning
+from util import timing
 
 np.random.seed(26)
 
@@ -17,16 +18,48 @@ np.random.seed(26)
 LABELS = ["Pattern Work", "Local Maneuvers", "Cross-Country"]
 HOW_MANY = 10
 
+# How the flights to label are chosen: default, margin, entropy, kcenter, cluster or committee
+QUERY_STRATEGY = "default"
+
+# Number of models of the committee (None for a single model) and how their disagreement is measured: vote_entropy
+# or kl. The committee strategy picks the flights they disagree the most on.
+COMMITTEE = None
+DISAGREEMENT = "vote_entropy"
+
+# Classifier: lbfgs, liblinear, sgd, nearest_centroid or auto (the fastest within BACKEND_TOLERANCE of the best
+# macro F1 on the validation flights, benchmarked once 100 flights are labeled)
+BACKEND = "lbfgs"
+BACKEND_TOLERANCE = .02
+
+# Reduce the features to REDUCTION_COMPONENTS columns: None, landmarks, nystroem or random
+REDUCTION = None
+REDUCTION_COMPONENTS = 64
+
+# Time the labeling loop, the summary is shown in the status bar and every measure is logged to TIMING_LOG
+TIMING = False
+TIMING_LOG = "timing.jsonl"
+
 # ==========================
 
 # -------------------------- #
 
 if __name__ == '__main__':
+    if TIMING:
+        timing.enable(TIMING_LOG)
+
     model = ActiveLearning(
         labels=LABELS,
         feature_file="~/Desktop/Thesis/Classification/train_data_AltGPS_new3.csv",
         data_dir="~/Desktop/Thesis/Data",
-        amount_to_label=3
+        amount_to_label=3,
+        journal="~/Desktop/Thesis/Classification/labels.journal",
+        query_strategy=QUERY_STRATEGY,
+        reduction=REDUCTION,
+        n_components=REDUCTION_COMPONENTS,
+        committee=COMMITTEE,
+        disagreement=DISAGREEMENT,
+        backend=BACKEND,
+        backend_tolerance=BACKEND_TOLERANCE
     )
 
     # Start application
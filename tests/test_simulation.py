@@ -0,0 +1,18 @@
+import pytest
+
+from active_learning.simulation import run, synthetic_features
+
+LABELS = ["A", "B", "C"]
+
+
+def test_validation_file_as_oracle(tmp_path):
+    features, _, validation = synthetic_features(str(tmp_path), 3000, labels=LABELS, n_validation=500)
+    rounds = run(features, validation, labels=LABELS, rounds=3, amount_to_label=5)
+    assert len(rounds) == 4
+    assert rounds["labeled"].iloc[-1] > 0
+
+
+def test_oracle_without_pool_flights(tmp_path):
+    features, _, validation = synthetic_features(str(tmp_path), 3000, labels=LABELS, n_validation=500)
+    with pytest.raises(ValueError):
+        run(features, validation, validation, labels=LABELS, rounds=1)
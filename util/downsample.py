@@ -0,0 +1,40 @@
+import numpy as np
+
+TIME_SERIES = ["AltGPS", "Roll", "Pitch", "HDG"]
+
+
+def minmax_indices(columns, buckets):
+    # Sorted indices of the minimum and maximum of every column in each of `buckets` consecutive slices. Drawn as
+    # a line, this looks the same as the full series on a canvas `buckets` pixels wide.
+    n = len(columns[0])
+    if buckets is None or n <= 2 * len(columns) * buckets:
+        return np.arange(n)
+
+    size = int(np.ceil(n / float(buckets)))
+    full = (n // size) * size
+    starts = np.arange(0, full, size)
+
+    picked = [np.array([0, n - 1])]
+    for values in columns:
+        values = np.asarray(values)
+        blocks = values[:full].reshape(-1, size)
+        picked += [starts + np.argmin(blocks, axis=1), starts + np.argmax(blocks, axis=1)]
+        if full < n:
+            picked.append(full + np.array([np.argmin(values[full:]), np.argmax(values[full:])]))
+
+    return np.unique(np.concatenate(picked))
+
+
+def downsample_flight(data, buckets):
+    # What the plots draw for a flight: channel -> (x, y) for the time series and "track" -> (longitude, latitude)
+    plot_data = {}
+    for channel in TIME_SERIES:
+        values = np.asarray(data[channel])
+        idx = minmax_indices([values], buckets)
+        plot_data[channel] = (idx, values[idx])
+
+    longitude, latitude = np.asarray(data["Longitude"]), np.asarray(data["Latitude"])
+    idx = minmax_indices([longitude, latitude], buckets)
+    plot_data["track"] = (longitude[idx], latitude[idx])
+
+    return plot_data
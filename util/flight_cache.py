@@ -0,0 +1,57 @@
+import threading
+from collections import OrderedDict
+
+
+class FlightCache(object):
+    # LRU cache bounded by the total size in bytes of its values. Every entry remembers the modification time of
+    # the file it was read from, a lookup with a different mtime is a miss and drops the stale entry.
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, mtime):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] != mtime:
+                self._remove(key)
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, mtime, value, nbytes):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            # Values that do not fit at all are not worth evicting everything else
+            if nbytes > self.max_bytes:
+                return
+
+            self._entries[key] = (mtime, value, nbytes)
+            self.size += nbytes
+            while self.size > self.max_bytes:
+                _, (_, _, evicted) = self._entries.popitem(last=False)
+                self.size -= evicted
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries), "bytes": self.size}
+
+    def _remove(self, key):
+        _, _, nbytes = self._entries.pop(key)
+        self.size -= nbytes
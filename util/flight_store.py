@@ -0,0 +1,169 @@
+import argparse
+import csv
+import os
+import threading
+
+import numpy as np
+
+CHANNELS = ["AltGPS", "Roll", "Pitch", "HDG", "Latitude", "Longitude"]
+
+# Name of the store inside the data directory it was built from
+STORE_DIRNAME = ".flight_store"
+
+INDEX_FILE = "index.csv"
+INDEX_COLUMNS = ["filename", "offset", "length", "mtime"]
+
+
+class FlightStore(object):
+    # Columnar copy of a directory of flights: one float32 file per channel with every flight concatenated, plus an
+    # index with the offset and length of each flight. Reads are slices of memory-mapped arrays, new flights are
+    # appended at the end of the files and of the index, which is always written last.
+    def __init__(self, path):
+        self.path = path
+        self._index = {}
+        self._arrays = {}
+        self._size = 0
+        self._index_mtime = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def exists(path):
+        return os.path.isfile(os.path.join(path, INDEX_FILE))
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return len(self._index)
+
+    def __contains__(self, filename):
+        with self._lock:
+            self._refresh()
+            return os.path.basename(filename) in self._index
+
+    def mtime(self, filename):
+        with self._lock:
+            self._refresh()
+            return self._index[os.path.basename(filename)][2]
+
+    def get(self, filename):
+        # Returns a dict channel -> read-only array view, or None if the flight is not in the store
+        with self._lock:
+            self._refresh()
+            entry = self._index.get(os.path.basename(filename))
+            if entry is None:
+                return None
+
+            offset, length, _ = entry
+            return {channel: self._arrays[channel][offset:offset + length] for channel in CHANNELS}
+
+    def append(self, flights):
+        # flights is a list of (filename, mtime, data) where data maps each channel to a 1D array
+        if not flights:
+            return
+
+        os.makedirs(self.path, exist_ok=True)
+        with self._lock:
+            self._refresh()
+
+        # Data first, then the index, a crash in between leaves unreferenced bytes that the next append drops
+        rows = []
+        for channel in CHANNELS:
+            with open(self._channel_file(channel), "ab") as fh:
+                fh.truncate(self._size * 4)
+                for _, _, data in flights:
+                    np.asarray(data[channel], dtype=np.float32).tofile(fh)
+
+        offset = self._size
+        for filename, mtime, data in flights:
+            length = len(data[CHANNELS[0]])
+            rows.append([os.path.basename(filename), offset, length, mtime])
+            offset += length
+
+        index_file = os.path.join(self.path, INDEX_FILE)
+        write_header = not os.path.isfile(index_file)
+        with open(index_file, "a", newline="") as fh:
+            writer = csv.writer(fh)
+            if write_header:
+                writer.writerow(INDEX_COLUMNS)
+            writer.writerows(rows)
+            fh.flush()
+            os.fsync(fh.fileno())
+
+        with self._lock:
+            self._index_mtime = None
+
+    def _channel_file(self, channel):
+        return os.path.join(self.path, channel + ".f32")
+
+    def _refresh(self):
+        # Reload the index and re-map the channels only when the index was appended to
+        index_file = os.path.join(self.path, INDEX_FILE)
+        try:
+            mtime = os.path.getmtime(index_file)
+        except OSError:
+            mtime = None
+        if mtime == self._index_mtime:
+            return
+
+        index = {}
+        size = 0
+        if mtime is not None:
+            with open(index_file, newline="") as fh:
+                for row in csv.DictReader(fh):
+                    offset, length = int(row["offset"]), int(row["length"])
+                    # Later rows win, a flight that changed on disk is appended again
+                    index[row["filename"]] = (offset, length, float(row["mtime"]))
+                    size = max(size, offset + length)
+
+        arrays = {}
+        for channel in CHANNELS:
+            if size:
+                arrays[channel] = np.memmap(self._channel_file(channel), dtype=np.float32, mode="r", shape=(size,))
+            else:
+                arrays[channel] = np.empty(0, dtype=np.float32)
+
+        self._index, self._arrays, self._size, self._index_mtime = index, arrays, size, mtime
+
+
+def ingest_directory(data_dir, store_path=None, batch_size=256):
+    # Converts the flights of data_dir that are missing from the store (or changed since they were stored)
+    from util.util import _loader, _read_flight
+
+    def read(item):
+        file_name, mtime = item
+        try:
+            df = _read_flight(os.path.join(data_dir, file_name))
+        except Exception:
+            return None
+        return file_name, mtime, {channel: df[channel].to_numpy(dtype=np.float32) for channel in CHANNELS}
+
+    data_dir = os.path.expanduser(data_dir)
+    store = FlightStore(store_path or os.path.join(data_dir, STORE_DIRNAME))
+
+    pending = []
+    for file_name in sorted(os.listdir(data_dir)):
+        if not file_name.lower().endswith(".csv"):
+            continue
+        mtime = os.path.getmtime(os.path.join(data_dir, file_name))
+        if file_name not in store or store.mtime(file_name) != mtime:
+            pending.append((file_name, mtime))
+
+    # Flights are parsed in parallel and written a batch at a time to keep memory bounded
+    added = 0
+    for start in range(0, len(pending), batch_size):
+        flights = [flight for flight in _loader.map(read, pending[start:start + batch_size]) if flight is not None]
+        store.append(flights)
+        added += len(flights)
+
+    return store, added
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Convert a directory of flight CSVs into a memory-mapped flight store")
+    parser.add_argument("data_dir", help="Directory with the raw flight CSV files")
+    parser.add_argument("--store", default=None,
+                        help="Where to write the store (default: {} inside data_dir)".format(STORE_DIRNAME))
+    args = parser.parse_args()
+
+    store, added = ingest_directory(args.data_dir, args.store)
+    print("Added {} flights, the store at '{}' has {} flights".format(added, store.path, len(store)))
@@ -0,0 +1,124 @@
+import functools
+import json
+import threading
+import time
+from collections import defaultdict, deque
+
+# Calls of every timer kept for the summary
+ROLLING = 100
+
+# Off by default, the timed functions then only pay for one attribute lookup
+enabled = False
+
+_lock = threading.Lock()
+_durations = defaultdict(lambda: deque(maxlen=ROLLING))
+_calls = defaultdict(int)
+_counters = defaultdict(int)
+_log = None
+
+
+def enable(log_file=None):
+    # Starts timing, every measure is also appended to log_file as a JSON line when given
+    global enabled, _log
+    with _lock:
+        if _log is not None:
+            _log.close()
+        _log = open(log_file, "a") if log_file is not None else None
+    enabled = True
+
+
+def disable():
+    global enabled, _log
+    enabled = False
+    with _lock:
+        if _log is not None:
+            _log.close()
+        _log = None
+
+
+def reset():
+    with _lock:
+        _durations.clear()
+        _calls.clear()
+        _counters.clear()
+
+
+def record(name, duration):
+    with _lock:
+        _durations[name].append(duration)
+        _calls[name] += 1
+        if _log is not None:
+            _log.write(json.dumps({"time": time.time(), "timer": name, "duration": duration,
+                                   "thread": threading.current_thread().name}) + "\n")
+            _log.flush()
+
+
+def count(name, amount=1):
+    if not enabled:
+        return
+    with _lock:
+        _counters[name] += amount
+        if _log is not None:
+            _log.write(json.dumps({"time": time.time(), "counter": name, "amount": amount}) + "\n")
+            _log.flush()
+
+
+class timer(object):
+    # Times the block of a with statement
+    def __init__(self, name):
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        if enabled:
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.start is not None:
+            record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+def timed(name):
+    # Decorator that times every call of a function
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def summary():
+    # Timers by name with the number of calls, and the mean, maximum and last duration of the recent calls.
+    # Counters by name with their total.
+    with _lock:
+        timers = {name: {"calls": _calls[name], "mean": sum(d) / len(d), "max": max(d), "last": d[-1]}
+                  for name, d in _durations.items() if d}
+        return timers, dict(_counters)
+
+
+def format_summary(top=4):
+    # One line with the timers that took the longest on average
+    timers, counters = summary()
+    slowest = sorted(timers.items(), key=lambda item: item[1]["mean"], reverse=True)[:top]
+    parts = ["{} {:.0f} ms".format(name, 1000 * stats["mean"]) for name, stats in slowest]
+    parts += ["{} {}".format(name, value) for name, value in sorted(counters.items())]
+    return " | ".join(parts)
+
+
+def export(filename):
+    # Writes the summary as JSON lines, one per timer and counter
+    timers, counters = summary()
+    with open(filename, "w") as fh:
+        for name, stats in sorted(timers.items()):
+            fh.write(json.dumps(dict(stats, timer=name)) + "\n")
+        for name, value in sorted(counters.items()):
+            fh.write(json.dumps({"counter": name, "count": value}) + "\n")
@@ -1,85 +1,278 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 import pandas as pd
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 from matplotlib.gridspec import GridSpec
 from matplotlib.figure import Figure
 
+from util import timing
+from util.downsample import downsample_flight
+from util.flight_cache import FlightCache
+from util.flight_store import FlightStore, CHANNELS, STORE_DIRNAME
 
-def plot_flight_to_label(filename, size_ts, size_lat_lon):
+# Parsed flights shared by the whole process, bounded by memory instead of by number of flights. The cached
+# flights are handed out as they are, so they must not be modified.
+flight_cache = FlightCache(max_bytes=512 * 1024 ** 2)
+
+# Flights reduced to the resolution they are drawn at, by file and resolution
+lod_cache = FlightCache(max_bytes=64 * 1024 ** 2)
 
-    data = load_flights([filename])[0]
+# Open flight stores by data directory
+_flight_stores = {}
 
-    fig_ts = Figure(figsize=size_ts, dpi=100)
-    ax = fig_ts.add_subplot(411)
-    ax.plot(data["AltGPS"])
-    ax.set_ylabel("AltGPS (m)")
-    ax.tick_params(labelbottom='off')
+# Threads used to read several flights at once, the C parser of pandas releases the GIL while tokenizing
+_loader = ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1))
 
-    ax = fig_ts.add_subplot(412, sharex=ax)
-    ax.plot(data["Roll"], color="darkgreen")
-    ax.set_ylabel("Roll")
-    ax.tick_params(labelbottom='off')
+# How many lines to look at when searching for the header of a flight
+HEADER_LINES = 10
 
-    ax = fig_ts.add_subplot(413, sharex=ax)
-    ax.plot(data["Pitch"], color="dodgerblue")
-    ax.set_ylabel("Pitch")
-    ax.tick_params(labelbottom='off')
 
-    ax = fig_ts.add_subplot(414, sharex=ax)
-    ax.plot(data["HDG"], color="tomato")
-    ax.set_ylabel("Heading")
-    ax.set_xlabel("Index")
+DPI = 100
 
-    fig_ts.set_tight_layout(True)
 
-    size_lat_lon = min(size_lat_lon), min(size_lat_lon)
-    fig_lat_lon = Figure(figsize=size_lat_lon, dpi=100)
-    ax = fig_lat_lon.add_subplot(111)
-    ax.plot(data["Longitude"], data["Latitude"])
-    ax.set_aspect('equal', 'datalim')
-    ax.set_xlabel("Longitude")
-    ax.set_ylabel("Latitude")
-    ax.yaxis.set_ticks_position('left')
-    ax.xaxis.set_ticks_position('bottom')
-    ax.spines['right'].set_visible(False)
-    ax.spines['top'].set_visible(False)
+def _inches(size):
+    # Sizes are given in pixels, as taken from the widgets that show the figures
+    return size[0] / float(DPI), size[1] / float(DPI)
 
-    fig_lat_lon.set_tight_layout(True)
 
-    return fig_ts, fig_lat_lon
+def _timed_figure(figsize, name):
+    # The canvas draws the figure when it is painted, long after draw() returns, so the drawing of the figure
+    # itself is what gets timed
+    fig = Figure(figsize=_inches(figsize), dpi=DPI)
+    fig.draw = timing.timed(name)(fig.draw)
+    return fig
 
 
-def plot_flights(file_names, shape, figsize):
+def _fix_layout(fig):
+    # Tight layout computed once and applied as fixed margins. A tight layout engine would solve it again on
+    # every draw.
+    fig.tight_layout()
+    fig.set_layout_engine(None)
 
-    all_data = load_flights(file_names)
 
-    gs = GridSpec(nrows=shape[0], ncols=shape[1])
-    fig = Figure(figsize=figsize, dpi=100)
+class FlightPlot(object):
+    # The figures of a flight to label, built once. Showing another flight replaces the data of the lines and
+    # rescales the axes, the figures, axes and canvases are kept.
+    def __init__(self, size_ts, size_lat_lon):
+        self.fig_ts = _timed_figure(size_ts, "plot.flight.render")
+        self.lines = {}
 
-    for i, data in enumerate(all_data):
-        row = i // shape[1]
-        col = i % shape[1]
-        ax = fig.add_subplot(gs[row, col])
-        ax.plot(data["AltGPS"])
-        ax.set_xlabel("Index")
+        ax = self.fig_ts.add_subplot(411)
+        self.lines["AltGPS"], = ax.plot([], [])
         ax.set_ylabel("AltGPS (m)")
-        ax.set_title(file_names[i])
+        ax.tick_params(labelbottom='off')
 
-    fig.set_tight_layout(True)
+        ax = self.fig_ts.add_subplot(412, sharex=ax)
+        self.lines["Roll"], = ax.plot([], [], color="darkgreen")
+        ax.set_ylabel("Roll")
+        ax.tick_params(labelbottom='off')
 
-    return fig
+        ax = self.fig_ts.add_subplot(413, sharex=ax)
+        self.lines["Pitch"], = ax.plot([], [], color="dodgerblue")
+        ax.set_ylabel("Pitch")
+        ax.tick_params(labelbottom='off')
+
+        ax = self.fig_ts.add_subplot(414, sharex=ax)
+        self.lines["HDG"], = ax.plot([], [], color="tomato")
+        ax.set_ylabel("Heading")
+        ax.set_xlabel("Index")
+
+        size_lat_lon = min(size_lat_lon), min(size_lat_lon)
+        self.fig_lat_lon = _timed_figure(size_lat_lon, "plot.track.render")
+        ax = self.fig_lat_lon.add_subplot(111)
+        self.track, = ax.plot([], [])
+        ax.set_aspect('equal', 'datalim')
+        ax.set_xlabel("Longitude")
+        ax.set_ylabel("Latitude")
+        ax.yaxis.set_ticks_position('left')
+        ax.xaxis.set_ticks_position('bottom')
+        ax.spines['right'].set_visible(False)
+        ax.spines['top'].set_visible(False)
+
+        # The layout is computed for the first flight shown and kept, see _fix_layout
+        self.laid_out = False
+
+    @timing.timed("plot.flight.update")
+    def update(self, plot_data):
+        # plot_data as returned by load_flight_lod
+        for channel, line in self.lines.items():
+            line.set_data(*plot_data[channel])
+        self.track.set_data(*plot_data["track"])
 
+        for ax in self.fig_ts.axes + self.fig_lat_lon.axes:
+            ax.relim()
+            ax.autoscale_view()
 
+        if not self.laid_out:
+            _fix_layout(self.fig_ts)
+            _fix_layout(self.fig_lat_lon)
+            self.laid_out = True
+
+    def draw(self):
+        # Redraw on the next paint of the canvases the figures are attached to
+        self.fig_ts.canvas.draw_idle()
+        self.fig_lat_lon.canvas.draw_idle()
+
+    def render(self):
+        # Draws both figures with Agg, which does not need the GUI thread, and returns their RGBA pixels
+        images = []
+        for fig in (self.fig_ts, self.fig_lat_lon):
+            canvas = fig.canvas if isinstance(fig.canvas, FigureCanvasAgg) else FigureCanvasAgg(fig)
+            canvas.draw()
+            images.append(np.array(canvas.buffer_rgba()))
+        return tuple(images)
+
+
+class FlightGridPlot(object):
+    # AltGPS of several flights in a grid, like FlightPlot the axes are built once and only their data changes
+    def __init__(self, shape, figsize):
+        gs = GridSpec(nrows=shape[0], ncols=shape[1])
+        self.fig = _timed_figure(figsize, "plot.grid.render")
+        self.lines = []
+
+        for i in range(shape[0] * shape[1]):
+            row = i // shape[1]
+            col = i % shape[1]
+            ax = self.fig.add_subplot(gs[row, col])
+            line, = ax.plot([], [])
+            ax.set_xlabel("Index")
+            ax.set_ylabel("AltGPS (m)")
+            self.lines.append(line)
+
+        self.laid_out = False
+
+    @timing.timed("plot.grid.update")
+    def update(self, file_names, all_plot_data):
+        # Cells without a flight are hidden
+        for i, line in enumerate(self.lines):
+            ax = line.axes
+            ax.set_visible(i < len(all_plot_data))
+            if i < len(all_plot_data):
+                line.set_data(*all_plot_data[i]["AltGPS"])
+                ax.set_title(file_names[i])
+                ax.relim()
+                ax.autoscale_view()
+
+        if not self.laid_out:
+            _fix_layout(self.fig)
+            self.laid_out = True
+
+    def draw(self):
+        self.fig.canvas.draw_idle()
+
+
+def plot_flight_to_label(filename, size_ts, size_lat_lon):
+    plot = FlightPlot(size_ts, size_lat_lon)
+    plot.update(load_flight_lod(filename, int(size_ts[0])))
+    return plot.fig_ts, plot.fig_lat_lon
+
+
+def plot_flights(file_names, shape, figsize):
+    plot = FlightGridPlot(shape, figsize)
+    plot.update(file_names, load_flights_lod(file_names, int(figsize[0] // shape[1])))
+    return plot.fig
+
+
+@timing.timed("load_flights_lod")
+def load_flights_lod(file_names, width):
+    file_names = list(file_names)
+    if len(file_names) == 1:
+        return [load_flight_lod(file_names[0], width)]
+    return list(_loader.map(lambda file_name: load_flight_lod(file_name, width), file_names))
+
+
+@timing.timed("load_flight_lod")
+def load_flight_lod(file_name, width):
+    # The flight reduced to the minimum and maximum of every pixel column of a plot `width` pixels wide, so
+    # drawing it costs the same no matter how long the flight is
+    key = os.path.abspath(os.path.expanduser(file_name))
+    mtime = _flight_mtime(key)
+
+    plot_data = lod_cache.get((key, width), mtime)
+    if plot_data is None:
+        timing.count("lod_cache.miss")
+        plot_data = downsample_flight(load_flight(file_name), width)
+        nbytes = sum(x.nbytes + y.nbytes for x, y in plot_data.values())
+        lod_cache.put((key, width), mtime, plot_data, nbytes)
+    return plot_data
+
+
+@timing.timed("load_flights")
 def load_flights(file_names):
-    dfs = []
-    file_names = set(file_names)
-    for file_name in file_names:
+    # Flights, as returned by load_flight, in the same order as file_names, which plot_flights relies on for the
+    # titles
+    file_names = list(file_names)
+    if len(file_names) == 1:
+        return [load_flight(file_names[0])]
+    return list(_loader.map(load_flight, file_names))
+
+
+@timing.timed("load_flight")
+def load_flight(file_name):
+    # A dict channel -> read-only float32 array, whether the flight comes from the flight store or from its CSV
+    key = os.path.abspath(os.path.expanduser(file_name))
+    mtime = _flight_mtime(key)
+
+    # Read zero-copy slices from the flight store of the data directory when it has an up to date copy
+    store = _flight_store(os.path.dirname(key))
+    if store is not None and key in store and (mtime is None or store.mtime(key) == mtime):
+        timing.count("flight_store.read")
+        return store.get(key)
+
+    if mtime is None:
+        print("Unexpected error while opening file '{}'".format(file_name))
+        raise IOError("No such flight: '{}'".format(file_name))
+
+    flight = flight_cache.get(key, mtime)
+    if flight is None:
+        timing.count("flight_cache.miss")
+        df = _read_flight(file_name)
+        flight = {channel: df[channel].to_numpy(dtype=np.float32) for channel in CHANNELS}
+        for values in flight.values():
+            values.flags.writeable = False
+        flight_cache.put(key, mtime, flight, sum(values.nbytes for values in flight.values()))
+    return flight
+
+
+def _flight_mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+def _flight_store(directory):
+    path = os.path.join(directory, STORE_DIRNAME)
+    store = _flight_stores.get(path)
+    if store is None and FlightStore.exists(path):
+        store = _flight_stores[path] = FlightStore(path)
+    return store
+
+
+def _find_header(file_name):
+    # Index of the first line that names all the channels, only the first few lines are read
+    with open(file_name, encoding="latin1") as fh:
+        for i, line in zip(range(HEADER_LINES), fh):
+            fields = [field.strip('"') for field in line.rstrip("\r\n").split(",")]
+            if all(channel in fields for channel in CHANNELS):
+                return i
+    raise KeyError("No header with the columns {} in '{}'".format(CHANNELS, file_name))
+
+
+@timing.timed("read_csv")
+def _read_flight(file_name):
+    try:
+        header = _find_header(file_name)
         try:
-            df = pd.read_csv(file_name, skiprows=2, encoding="latin1")
-            df = df[["AltGPS", "Roll", "Pitch", "HDG", "Latitude", "Longitude"]]
-        except KeyError:
-            df = pd.read_csv(file_name, skiprows=1, encoding="latin1")
-            df = df[["AltGPS", "Roll", "Pitch", "HDG", "Latitude", "Longitude"]]
-        except:
-            print("Unexpected error while opening file '{}'".format(file_name))
-            raise
-        dfs.append(df)
-    return dfs
+            df = pd.read_csv(file_name, skiprows=header, usecols=CHANNELS, dtype=np.float32, engine="c",
+                             encoding="latin1")
+        except ValueError:
+            # Some value is not a number, parse the columns as they are and turn those values into NaN
+            df = pd.read_csv(file_name, skiprows=header, usecols=CHANNELS, engine="c", encoding="latin1")
+            df = df.apply(pd.to_numeric, errors="coerce").astype(np.float32)
+    except:
+        print("Unexpected error while opening file '{}'".format(file_name))
+        raise
+    return df[CHANNELS]